@@ -0,0 +1,61 @@
+"""
+Benchmark: granting chips to a whole role, per user vs set-based.
+
+Compares the per-member path an admin loop would take (ensure_user +
+add_chips for each member, then a ledger flush) with one bulk_add_chips
+call, plus a guild-wide bulk_decay_chips and bulk_set_chips.
+Usage: python benchmarks/bench_bulk.py [members]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+GUILD = "100000000000000000"
+
+
+async def per_user(usernames: dict[str, str], amount: int) -> float:
+    start = time.perf_counter()
+    for user_id, name in usernames.items():
+        await db.ensure_user(GUILD, user_id, name)
+        await db.add_chips(GUILD, user_id, name, amount, source="bench")
+    await db.flush_ledger()
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(path: str, members: int):
+    db.configure("sqlite", path=path)
+    await db.init()
+    first = {str(200000000000000000 + i): f"user{i}" for i in range(members)}
+    second = {str(300000000000000000 + i): f"user{i}" for i in range(members)}
+    loop_ms = await per_user(first, 500)
+    grant = await db.bulk_add_chips(GUILD, second, 500)
+    decay = await db.bulk_decay_chips(GUILD, 10)
+    reset = await db.bulk_set_chips(GUILD, 0)
+    problems = await db.check_rank_cache(GUILD)
+    await db.close()
+
+    print(f"{members} members per grant, chunks of {db.BULK_CHUNK_SIZE} ids")
+    print(f"{'operation':<36}{'rows':>8}{'transactions':>14}{'ms':>10}")
+    # One ensure_user transaction per member, plus the batched ledger flush
+    print(f"{'ensure_user + add_chips loop':<36}{members:>8}{members + 1:>14}{loop_ms:>10.1f}")
+    for name, report in (("bulk_add_chips", grant), ("bulk_decay_chips (whole guild)", decay),
+                         ("bulk_set_chips (whole guild)", reset)):
+        print(f"{name:<36}{report['rows']:>8}{1:>14}{report['elapsed_ms']:>10.1f}")
+    print(f"grant speedup: {loop_ms / grant['elapsed_ms']:.1f}x; rank cache consistent: {not problems}")
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "bench.db"), members))
+
+
+if __name__ == "__main__":
+    main()
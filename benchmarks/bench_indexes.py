@@ -0,0 +1,161 @@
+"""
+Benchmark: hot query latency with and without the schema migration indexes.
+
+Seeds a throwaway database with 100k users and a year of daily chatter /
+activity rows, then times the db.py statements that depend on the indexes.
+Usage: python benchmarks/bench_indexes.py [users] [days] [daily_users]
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import asyncio
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+GUILD = "100000000000000000"
+INDEXES = [
+    "idx_users_guild_chips",
+    "idx_daily_chatter_guild_date_count",
+    "idx_daily_activity_guild_date_total",
+    "idx_question_usage_guild_type",
+]
+
+
+def seed(path: str, users: int, days: int, daily_users: int):
+    conn = sqlite3.connect(path)
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO users (guild_id, user_id, chips, created_at) VALUES (?, ?, ?, 0)",
+        ((GUILD, str(i), rng.randint(0, 1_000_000)) for i in range(users))
+    )
+    conn.executemany(
+        "INSERT INTO user_directory (guild_id, user_id, username) VALUES (?, ?, ?)",
+        ((GUILD, str(i), f"user{i}") for i in range(users))
+    )
+    start = date.today() - timedelta(days=days)
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        ids = rng.sample(range(users), daily_users)
+        conn.executemany(
+            "INSERT INTO daily_chatter (guild_id, user_id, message_count, date) VALUES (?, ?, ?, ?)",
+            ((GUILD, str(u), rng.randint(1, 500), day) for u in ids)
+        )
+        conn.executemany(
+            "INSERT INTO daily_activity (guild_id, user_id, message_points, vc_minutes, date) VALUES (?, ?, ?, ?, ?)",
+            ((GUILD, str(u), rng.randint(0, 500), rng.randint(0, 300), day) for u in ids)
+        )
+        conn.executemany(
+            "INSERT INTO question_usage (guild_id, question_type, question_index, used_at) VALUES (?, ?, ?, '')",
+            ((GUILD, qtype, f"question {d}") for qtype in ("casual", "typology_type", "typology_matchups"))
+        )
+    conn.commit()
+    conn.close()
+
+
+def drop_indexes(path: str):
+    conn = sqlite3.connect(path)
+    for name in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    conn.close()
+
+
+def create_indexes(path: str):
+    conn = sqlite3.connect(path)
+    for _, statements in db.MIGRATIONS:
+        for sql in statements:
+            if "CREATE INDEX" in sql:
+                # Later migrations recreate some indexes without IF NOT EXISTS
+                if "IF NOT EXISTS" not in sql:
+                    sql = sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+                conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+# The statements behind the index-dependent helpers. Leaderboard and rank
+# reads are served by the rank cache since user-009, but their SQL still
+# backs the cache consistency check.
+QUERIES = {
+    "leaderboard page": (
+        "SELECT user_id, chips FROM users WHERE guild_id = ? ORDER BY chips DESC LIMIT 10",
+        (GUILD,),
+    ),
+    "rank count": (
+        """SELECT COUNT(*) + 1 FROM users WHERE guild_id = ? AND chips > (
+               SELECT COALESCE(chips, 0) FROM users WHERE guild_id = ? AND user_id = ?)""",
+        (GUILD, GUILD, "12345"),
+    ),
+    "get_top_chatters": (
+        """SELECT c.user_id, COALESCE(n.username, ''), c.message_count FROM daily_chatter c
+           LEFT JOIN user_directory n ON n.guild_id = c.guild_id AND n.user_id = c.user_id
+           WHERE c.guild_id = ? AND c.date = ? ORDER BY c.message_count DESC LIMIT 3""",
+        None,
+    ),
+    "get_top_activity": (
+        """SELECT a.user_id, COALESCE(n.username, ''), a.message_points, a.vc_minutes,
+                  (a.message_points + a.vc_minutes) as total
+           FROM daily_activity a LEFT JOIN user_directory n ON n.guild_id = a.guild_id AND n.user_id = a.user_id
+           WHERE a.guild_id = ? AND a.date = ? ORDER BY total DESC LIMIT 3""",
+        None,
+    ),
+    "get_used_questions": (
+        "SELECT question_index FROM question_usage WHERE guild_id = ? AND question_type = ?",
+        (GUILD, "casual"),
+    ),
+}
+
+
+async def time_queries(days: int, reps: int) -> dict[str, float]:
+    probe_day = (date.today() - timedelta(days=days // 2)).isoformat()
+    results = {}
+    async with db.get_connection() as conn:
+        for name, (sql, params) in QUERIES.items():
+            params = params or (GUILD, probe_day)
+            await (await conn.execute(sql, params)).fetchall()  # warm the page cache
+            start = time.perf_counter()
+            for _ in range(reps):
+                await (await conn.execute(sql, params)).fetchall()
+            results[name] = (time.perf_counter() - start) / reps * 1000
+    return results
+
+
+async def run(path: str, indexed: bool, days: int, reps: int) -> dict[str, float]:
+    if not indexed:
+        drop_indexes(path)
+    else:
+        create_indexes(path)
+    try:
+        return await time_queries(days, reps)
+    finally:
+        await db.close()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    daily_users = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    reps = 20
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db.configure("sqlite", path=path)
+        asyncio.run(db.init())
+        asyncio.run(db.close())
+        seed(path, users, days, daily_users)
+        before = asyncio.run(run(path, False, days, reps))
+        after = asyncio.run(run(path, True, days, reps))
+    print(f"{users} users, {days} days x {daily_users} daily rows, mean of {reps} calls")
+    print(f"{'query':<20}{'no index (ms)':>15}{'indexed (ms)':>15}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<20}{before[name]:>15.3f}{after[name]:>15.3f}{before[name] / after[name]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: degraded mode with the offline write journal.
+
+Runs the bot's write helpers against the fake libsql driver, switches the
+server off mid-run (connection refused), keeps writing, then switches it
+back on and waits for the replay; then does the same with a server that
+hangs instead of refusing, so calls time out, and with one that applies
+commits but never answers them (the ambiguous case the idempotency keys
+exist for). Reports write latency online
+vs journaled, fsyncs per journaled batch, replay time, and checks that
+every write reached the primary exactly once (including a second replay of
+the same records) and that the timed-out connection left the pool.
+Usage: python benchmarks/bench_journal.py [writes_per_phase]
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import asyncio
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import db  # noqa: E402
+import fake_libsql  # noqa: E402
+
+GUILD = "100000000000000000"
+USERS = [str(200000000000000000 + i) for i in range(20)]
+
+
+async def phase(writes: int, tag: str) -> float:
+    """Mixed helper writes; returns mean ms per helper call."""
+    start = time.perf_counter()
+    for i in range(writes):
+        user = USERS[i % len(USERS)]
+        await db.add_chips(GUILD, user, f"user{user[-2:]}", 1, source="bench")
+        await db.increment_chatter(GUILD, user, f"user{user[-2:]}")
+        if i % 10 == 0:
+            await db.mark_question_used(GUILD, "casual", f"{tag} question {i}")
+            await db.flush_counters()
+            await db.flush_ledger()
+    await db.flush_counters()
+    await db.flush_ledger()
+    return (time.perf_counter() - start) / writes * 1000
+
+
+def primary_totals(path: str) -> tuple[int, int, int]:
+    conn = sqlite3.connect(path)
+    chips = conn.execute("SELECT COALESCE(SUM(delta), 0) FROM chip_ledger").fetchone()[0]
+    chatter = conn.execute("SELECT COALESCE(SUM(message_count), 0) FROM daily_chatter").fetchone()[0]
+    questions = conn.execute("SELECT COUNT(*) FROM question_usage").fetchone()[0]
+    conn.close()
+    return chips, chatter, questions
+
+
+async def recovered() -> float:
+    """Wait for the probe to replay the journal; returns ms taken."""
+    start = time.perf_counter()
+    while db._degraded:
+        await asyncio.sleep(0.01)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run(tmp: str, writes: int):
+    primary = os.path.join(tmp, "primary.db")
+    journal = os.path.join(tmp, "bot_data.journal")
+    fake_libsql.install(primary)
+    db.TURSO_TIMEOUT_SECONDS = 0.5
+    db.JOURNAL_PROBE_SECONDS = 0.2
+    db.configure("turso", url="libsql://fake", token="fake",
+                 journal=journal, replica=os.path.join(tmp, "replica.db"))
+    await db.init()
+
+    online_ms = await phase(writes, "online")
+
+    fake_libsql.ONLINE = False
+    offline_ms = await phase(writes, "offline")
+    # Balances and cached state keep answering from memory during the outage
+    balance = await db.get_balance(GUILD, USERS[0])
+    journaled = db.JOURNAL_STATS.copy()
+    shutil.copyfile(journal, journal + ".copy")
+
+    fake_libsql.ONLINE = True
+    replay_ms = await recovered()
+
+    # Replaying the same records again (as after a crash mid-replay) must be a no-op
+    shutil.copyfile(journal + ".copy", journal)
+    await db.replay_journal()
+    stats = db.get_db_stats()["journal"]
+
+    # A server that stops answering: the first call times out, the rest are journaled
+    fake_libsql.STALL = "request"
+    hung_ms = await phase(writes, "hung")
+    fake_libsql.STALL = None
+    hung_replay_ms = await recovered()
+
+    # Commits land but their replies are lost: journaled, then skipped on replay
+    duplicates = db.JOURNAL_STATS["duplicates"]
+    fake_libsql.STALL, fake_libsql.STALL_OPS = "reply", {"commit", "executescript"}
+    lost_ms = await phase(writes, "lost")
+    fake_libsql.STALL, fake_libsql.STALL_OPS = None, None
+    await recovered()
+    landed = db.JOURNAL_STATS["duplicates"] - duplicates
+    await db.set_state(GUILD, "after_hang", "1")
+    pool = db._get_pool().stats.copy()
+    await db.close()
+
+    chips, chatter, questions = primary_totals(primary)
+    expected = 4 * writes, 4 * writes, 4 * ((writes + 9) // 10)
+    print(f"{writes} helper writes per phase, {len(USERS)} users")
+    print(f"{'phase':<24}{'ms / write':>12}")
+    print(f"{'online':<24}{online_ms:>12.3f}")
+    print(f"{'offline (journaled)':<24}{offline_ms:>12.3f}")
+    print(f"{'hung (journaled)':<24}{hung_ms:>12.3f}  (first call waits {db.TURSO_TIMEOUT_SECONDS}s)")
+    print(f"{'commit reply lost':<24}{lost_ms:>12.3f}")
+    print(f"journal: {journaled['records']} records, {journaled['statements']} statements, "
+          f"{journaled['fsyncs']} fsyncs ({journaled['fsyncs'] / max(journaled['records'], 1):.2f} per batch)")
+    print(f"replay after reconnect: {replay_ms:.0f}ms (includes up to {db.JOURNAL_PROBE_SECONDS}s probe delay)")
+    print(f"second replay: {stats['duplicates']} duplicate records skipped, {stats['rejected']} rejected")
+    print(f"replay after the hang: {hung_replay_ms:.0f}ms")
+    print(f"timeouts: {db.TURSO_STATS['timeouts']}; connections discarded by the pool: {pool['discarded']}")
+    print(f"lost commit replies: {landed} journaled record(s) had already landed and were skipped")
+    print(f"balance served during outage: {balance}")
+    status = "OK" if (chips, chatter, questions) == expected else "MISMATCH"
+    print(f"primary totals (chips, chatter, questions): {(chips, chatter, questions)} expected {expected} {status}")
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(tmp, writes))
+
+
+if __name__ == "__main__":
+    main()
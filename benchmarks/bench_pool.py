@@ -0,0 +1,55 @@
+"""
+Benchmark: connect-per-call vs pooled connections on the local SQLite backend,
+with the in-memory backend as a no-disk baseline.
+
+Runs the hot per-message helpers against a throwaway database file and prints
+ops/sec for each mode. Usage: python benchmarks/bench_pool.py [ops]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+async def workload(ops: int) -> float:
+    gid = "1"
+    start = time.perf_counter()
+    for i in range(ops):
+        uid = str(i % 50)
+        await db.get_state(gid, f"user_last_msg_{uid}")
+        await db.set_state(gid, "last_message_time", str(i))
+        await db.increment_chatter(gid, uid, f"user{uid}")
+        await db.add_chips(gid, uid, f"user{uid}", 1)
+        await db.get_balance(gid, uid)
+    return ops * 5 / (time.perf_counter() - start)
+
+
+async def run(backend: str, pool_size: int, ops: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(backend, path=os.path.join(tmp, "bench.db"), name=f"bench{pool_size}")
+        db.POOL_SIZE = pool_size
+        await db.init()
+        try:
+            return await workload(ops)
+        finally:
+            await db.close()
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    before = asyncio.run(run("sqlite", 0, ops))
+    after = asyncio.run(run("sqlite", 4, ops))
+    memory = asyncio.run(run("memory", 4, ops))
+    print(f"connect-per-call : {before:10.0f} ops/sec")
+    print(f"pooled           : {after:10.0f} ops/sec  ({after / before:.1f}x)")
+    print(f"pooled, :memory: : {memory:10.0f} ops/sec  ({memory / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Query plan regression check: EXPLAIN QUERY PLAN for every statement db.py issues.
+
+Seeds a benchmark database, drives every public db.py helper once while
+recording each SQL statement the driver receives (with the helper that
+issued it), then runs EXPLAIN QUERY PLAN on each distinct statement.
+Any SCAN of a watched table that is not in EXPECTED_SCANS is a regression;
+so is a public helper the driver below does not exercise.
+Writes a JSON report to stdout (or to report.json) and a summary to stderr;
+exits 1 when something regressed.
+Usage: python benchmarks/bench_query_plans.py [report.json] [users]
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import asyncio
+import inspect
+import tempfile
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import db  # noqa: E402
+from bench_indexes import GUILD, seed  # noqa: E402
+
+WATCHED = {"users", "daily_chatter", "daily_activity", "question_usage", "bot_state"}
+
+
+def normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+# (helper, normalized statement, plan detail) for scans that read or rewrite the
+# whole table on purpose. Keyed on the exact statement and plan, so a new scan
+# through the same helper or on the same table is still a regression.
+EXPECTED_SCANS = {
+    ("load_state_cache", "SELECT guild_id, key, value FROM bot_state", "SCAN bot_state"):
+        "loads every guild's state into the cache at startup",
+    **{
+        ("_delete_batched", normalize(db._delete_batched_sql(table, keys, where)), detail): reason
+        for table, keys, where, detail, reason in (
+            ("daily_chatter", "guild_id, date, user_id", "date < ?",
+             "SCAN daily_chatter USING COVERING INDEX idx_daily_chatter_guild_date_count",
+             "retention sweep over every guild"),
+            ("daily_activity", "guild_id, date, user_id", "date < ?",
+             "SCAN daily_activity USING COVERING INDEX idx_daily_activity_guild_date_total",
+             "retention sweep over every guild"),
+            ("question_usage", "id", "used_at > 0 AND used_at < ?", "SCAN question_usage",
+             "retention sweep over every guild (used_at is not indexed)"),
+        )
+    },
+}
+
+USER, OTHER = "7", "8"
+DAY = "2000-01-01"
+
+# One call per public helper, in an order where each sees the state it needs
+DRIVER = [
+    ("get_schema_version", lambda: db.get_schema_version()),
+    ("migrate", lambda: db.migrate()),
+    ("load_state_cache", lambda: db.load_state_cache()),
+    ("load_game_mirror", lambda: db.load_game_mirror()),
+    ("ensure_user", lambda: db.ensure_user(GUILD, USER, "user7")),
+    ("add_chips", lambda: db.add_chips(GUILD, USER, "user7", 100)),
+    ("set_chips", lambda: db.set_chips(GUILD, OTHER, "user8", 50)),
+    ("transfer_chips", lambda: db.transfer_chips(GUILD, USER, "user7", OTHER, "user8", 10)),
+    ("get_balance", lambda: db.get_balance(GUILD, USER)),
+    ("get_rank", lambda: db.get_rank(GUILD, USER)),
+    ("get_leaderboard", lambda: db.get_leaderboard(GUILD)),
+    ("get_total_users", lambda: db.get_total_users(GUILD)),
+    ("flush_ledger", lambda: db.flush_ledger()),
+    ("check_rank_cache", lambda: db.check_rank_cache(GUILD)),
+    ("compact_ledger", lambda: db.compact_ledger()),
+    ("bulk_add_chips", lambda: db.bulk_add_chips(GUILD, {USER: "user7", "9": "user9"}, 5)),
+    ("bulk_decay_chips", lambda: db.bulk_decay_chips(GUILD, 10)),
+    ("bulk_set_chips", lambda: db.bulk_set_chips(GUILD, 0, user_ids=[USER, OTHER])),
+    ("increment_chatter", lambda: db.increment_chatter(GUILD, USER, "user7")),
+    ("increment_activity_message", lambda: db.increment_activity_message(GUILD, USER, "user7")),
+    ("add_vc_minutes", lambda: db.add_vc_minutes(GUILD, USER, "user7", 5)),
+    ("flush_counters", lambda: db.flush_counters()),
+    ("flush_directory", lambda: db.flush_directory()),
+    ("get_top_chatters", lambda: db.get_top_chatters(GUILD, DAY)),
+    ("clear_daily_chatter", lambda: db.clear_daily_chatter(GUILD, DAY)),
+    ("get_top_activity", lambda: db.get_top_activity(GUILD, DAY)),
+    ("clear_daily_activity", lambda: db.clear_daily_activity(GUILD, DAY)),
+    ("mark_question_used", lambda: db.mark_question_used(GUILD, "casual", "question x")),
+    ("get_used_questions", lambda: db.get_used_questions(GUILD, "casual")),
+    ("reset_questions", lambda: db.reset_questions(GUILD, "typology_type")),
+    ("set_state", lambda: db.set_state(GUILD, "k", "v")),
+    ("get_state", lambda: db.get_state(GUILD, "k")),
+    ("set_states", lambda: db.set_states(GUILD, {"a": "1", "b": "2"})),
+    ("get_states", lambda: db.get_states(GUILD, ["a", "b"])),
+    ("delete_state", lambda: db.delete_state(GUILD, "k")),
+    ("record_message", lambda: db.record_message(GUILD, USER, "user7", "1")),
+    ("set_channel", lambda: db.set_channel(GUILD, "chatter", "1")),
+    ("get_channel", lambda: db.get_channel(GUILD, "chatter")),
+    ("get_all_channels", lambda: db.get_all_channels(GUILD)),
+    ("add_blacklisted_channel", lambda: db.add_blacklisted_channel(GUILD, "2")),
+    ("is_channel_blacklisted", lambda: db.is_channel_blacklisted(GUILD, "2")),
+    ("get_blacklisted_channels", lambda: db.get_blacklisted_channels(GUILD)),
+    ("remove_blacklisted_channel", lambda: db.remove_blacklisted_channel(GUILD, "2")),
+    ("create_word_game", lambda: db.create_word_game(GUILD, "1", "1")),
+    ("get_word_game", lambda: db.get_word_game(GUILD)),
+    ("add_word", lambda: db.add_word(GUILD, "apple", USER, "")),
+    ("update_word_game_message", lambda: db.update_word_game_message(GUILD, "2")),
+    ("end_word_game", lambda: db.end_word_game(GUILD)),
+    ("start_vc_session", lambda: db.start_vc_session(GUILD, USER, "user7")),
+    ("get_all_vc_sessions", lambda: db.get_all_vc_sessions(GUILD)),
+    ("end_vc_session", lambda: db.end_vc_session(GUILD, USER)),
+    ("create_chip_drop", lambda: db.create_chip_drop(GUILD, "1", "1", 10, "trivia", "a")),
+    ("get_chip_drop", lambda: db.get_chip_drop(GUILD)),
+    ("delete_chip_drop", lambda: db.delete_chip_drop(GUILD)),
+    ("set_typology_field", lambda: db.set_typology_field(GUILD, USER, "mbti", "INTP")),
+    ("get_typology_profile", lambda: db.get_typology_profile(GUILD, USER)),
+    ("dnd_add_item", lambda: db.dnd_add_item("hero", "rope", 2)),
+    ("dnd_remove_item", lambda: db.dnd_remove_item("hero", "rope", 1)),
+    ("dnd_get_inventory", lambda: db.dnd_get_inventory("hero")),
+    ("dnd_get_all_inventories", lambda: db.dnd_get_all_inventories()),
+    ("sync_replica", lambda: db.sync_replica()),
+    ("replay_journal", lambda: db.replay_journal()),
+    # question_usage is kept by default; opt in so its sweep is still planned
+    ("run_maintenance", lambda: db.run_maintenance({"question_usage": 180}, active_vc={})),
+]
+
+ALIAS_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+NOT_ALIASES = {"where", "on", "set", "join", "left", "inner", "cross", "group", "order", "limit",
+               "values", "using", "select", "default", "returning", "as", "natural"}
+SCAN_RE = re.compile(r"^SCAN (\w+)(?: USING (.*))?$")
+PLANNED = ("select", "insert", "update", "delete", "with", "replace")
+
+
+def record_statements() -> list[tuple[str, str, tuple]]:
+    """Hook the aiosqlite driver so every statement is kept with its issuing helper."""
+    captured = []
+    real_execute = db.aiosqlite.Connection.execute
+    real_executemany = db.aiosqlite.Connection.executemany
+
+    def execute(self, sql, parameters=None):
+        captured.append((db._caller(), sql, tuple(parameters or ())))
+        return real_execute(self, sql, parameters)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        captured.append((db._caller(), sql, tuple(seq_of_params[0]) if seq_of_params else ()))
+        return real_executemany(self, sql, seq_of_params)
+
+    db.aiosqlite.Connection.execute = execute
+    db.aiosqlite.Connection.executemany = executemany
+    return captured
+
+
+async def drive(path: str, backups: str) -> list[str]:
+    """Run every public helper against the seeded database; returns the ones the driver skips."""
+    db.configure("sqlite", path=path)
+    db.BACKUP_DIR = backups
+    await db.init()
+    for _, call in DRIVER:
+        await call()
+    await db.convert_auto_vacuum()  # local files only, so not in DRIVER (bench_turso reuses it)
+    backup = await db.create_backup()
+    await db.restore_backup(backup["path"])
+    await db.close()
+
+    covered = {name for name, _ in DRIVER} | {"init", "close", "convert_auto_vacuum",
+                                              "create_backup", "restore_backup"}
+    public = {name for name, fn in vars(db).items()
+              if not name.startswith("_") and inspect.iscoroutinefunction(fn)
+              and getattr(fn, "__module__", None) == "db"}
+    return sorted(public - covered)
+
+
+def aliases(sql: str) -> dict[str, str]:
+    found = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        found[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            found[alias] = table
+    return found
+
+
+def explain(path: str, captured: list[tuple[str, str, tuple]]) -> list[dict]:
+    conn = sqlite3.connect(path)
+    seen, results = set(), []
+    for caller, sql, params in captured:
+        text = normalize(sql)
+        if (caller, text) in seen or not text.lower().startswith(PLANNED):
+            continue
+        seen.add((caller, text))
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            results.append({"caller": caller, "sql": text, "error": str(e), "plan": [], "scans": []})
+            continue
+        names = aliases(sql)
+        scans = []
+        for _, _, _, detail in rows:
+            match = SCAN_RE.match(detail)
+            table = names.get(match.group(1)) if match else None
+            if table in WATCHED:
+                scans.append({
+                    "table": table,
+                    "detail": detail,
+                    "index": match.group(2),
+                    "expected": EXPECTED_SCANS.get((caller, text, detail)),
+                })
+        results.append({"caller": caller, "sql": text, "plan": [row[3] for row in rows], "scans": scans})
+    conn.close()
+    return results
+
+
+def main():
+    out = sys.argv[1] if len(sys.argv) > 1 else None
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    # db.py logs with print(); keep stdout for the report
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        path = os.path.join(tmp, "bench.db")
+        db.configure("sqlite", path=path)
+        asyncio.run(db.init())
+        asyncio.run(db.close())
+        seed(path, users, 30, min(users, 100))
+        captured = record_statements()
+        missing = asyncio.run(drive(path, os.path.join(tmp, "backups")))
+        statements = explain(path, captured)
+
+    regressions = [
+        {"caller": s["caller"], "sql": s["sql"], "detail": scan["detail"]}
+        for s in statements for scan in s["scans"] if not scan["expected"]
+    ]
+    errors = [s for s in statements if "error" in s]
+    report = {
+        "sqlite_version": sqlite3.sqlite_version,
+        "schema_version": db.SCHEMA_VERSION,
+        "watched_tables": sorted(WATCHED),
+        "statements": statements,
+        "regressions": regressions,
+        "unexercised_helpers": missing,
+        "ok": not regressions and not missing and not errors,
+    }
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    scanned = sum(1 for s in statements if s["scans"])
+    scans = sum(len(s["scans"]) for s in statements)
+    print(f"{len(statements)} distinct statements from {len({s['caller'] for s in statements})} helpers; "
+          f"{scanned} of them make {scans} scans of a watched table "
+          f"({len(regressions)} unexpected)", file=sys.stderr)
+    for s in statements:
+        for scan in s["scans"]:
+            status = "expected" if scan["expected"] else "REGRESSION"
+            print(f"  {status:<12}{s['caller']:<28}{scan['detail']}", file=sys.stderr)
+    for s in errors:
+        print(f"  {'ERROR':<12}{s['caller']:<28}{s['error']}", file=sys.stderr)
+    if missing:
+        print(f"  helpers not exercised (add them to DRIVER): {', '.join(missing)}", file=sys.stderr)
+    print("OK" if report["ok"] else "FAILED", file=sys.stderr)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
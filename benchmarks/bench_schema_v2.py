@@ -0,0 +1,179 @@
+"""
+Benchmark: file size, per-table size and hot query latency before and after
+the compact schema v2 migration (integer ids, epoch-ms timestamps, WITHOUT ROWID).
+
+Seeds a v6 database with realistic snowflake ids and ISO timestamps, copies
+it, migrates the copy to the latest schema and VACUUMs both before comparing.
+Usage: python benchmarks/bench_schema_v2.py [users] [days] [daily_users]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+GUILD = 100000000000004242
+V2_STEP = 7
+
+
+def apply_migrations(path: str, steps: list[tuple[str, list[str]]]):
+    conn = sqlite3.connect(path)
+    for _, statements in steps:
+        for sql in statements:
+            conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def snowflake(rng: random.Random) -> int:
+    return rng.randint(10**17, 10**18 * 2)
+
+
+def seed(path: str, users: int, days: int, daily_users: int) -> int:
+    """Fill a v6 database and return a user id to probe the rank count with."""
+    conn = sqlite3.connect(path)
+    rng = random.Random(42)
+    ids = [snowflake(rng) for _ in range(users)]
+    now = datetime.now(timezone.utc)
+    conn.executemany(
+        "INSERT INTO users (guild_id, user_id, username, chips, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((str(GUILD), str(u), f"user{i}", rng.randint(0, 1_000_000),
+          (now - timedelta(seconds=rng.randint(0, 86400 * 365))).isoformat())
+         for i, u in enumerate(ids))
+    )
+    start = date.today() - timedelta(days=days)
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        picked = rng.sample(ids, daily_users)
+        conn.executemany(
+            "INSERT INTO daily_chatter (guild_id, user_id, username, message_count, date) VALUES (?, ?, ?, ?, ?)",
+            ((str(GUILD), str(u), f"user{u % 100000}", rng.randint(1, 500), day) for u in picked)
+        )
+        conn.executemany(
+            "INSERT INTO daily_activity (guild_id, user_id, username, message_points, vc_minutes, date) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((str(GUILD), str(u), f"user{u % 100000}", rng.randint(0, 500), rng.randint(0, 300), day)
+             for u in picked)
+        )
+        conn.executemany(
+            "INSERT INTO question_usage (guild_id, question_type, question_index, used_at) VALUES (?, ?, ?, ?)",
+            ((str(GUILD), qtype, f"question {d}", f"{day}T12:00:00+00:00")
+             for qtype in ("casual", "typology_type", "typology_matchups"))
+        )
+    conn.executemany(
+        "INSERT INTO chip_ledger (guild_id, user_id, delta, source, ts) VALUES (?, ?, ?, 'bench', ?)",
+        ((str(GUILD), str(rng.choice(ids)), rng.randint(-50, 50),
+          (now - timedelta(seconds=rng.randint(0, 86400))).isoformat()) for _ in range(users))
+    )
+    conn.commit()
+    conn.close()
+    return ids[len(ids) // 2]
+
+
+def vacuum(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def table_sizes(path: str) -> dict[str, int]:
+    """Bytes per table/index via dbstat, or {} when SQLite was built without it."""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return dict(rows)
+
+
+QUERIES = {
+    "leaderboard page": (
+        "SELECT user_id, username, chips FROM users WHERE guild_id = ? ORDER BY chips DESC LIMIT 10",
+        lambda g, u, day: (g,),
+    ),
+    "rank count": (
+        """SELECT COUNT(*) + 1 FROM users WHERE guild_id = ? AND chips > (
+               SELECT COALESCE(chips, 0) FROM users WHERE guild_id = ? AND user_id = ?)""",
+        lambda g, u, day: (g, g, u),
+    ),
+    "balance lookup": (
+        "SELECT chips FROM users WHERE guild_id = ? AND user_id = ?",
+        lambda g, u, day: (g, u),
+    ),
+    "get_top_chatters": (
+        """SELECT user_id, username, message_count FROM daily_chatter
+           WHERE guild_id = ? AND date = ? ORDER BY message_count DESC LIMIT 3""",
+        lambda g, u, day: (g, day),
+    ),
+    "get_top_activity": (
+        """SELECT user_id, username, message_points, vc_minutes, (message_points + vc_minutes) as total
+           FROM daily_activity WHERE guild_id = ? AND date = ? ORDER BY total DESC LIMIT 3""",
+        lambda g, u, day: (g, day),
+    ),
+    "get_used_questions": (
+        "SELECT question_index FROM question_usage WHERE guild_id = ? AND question_type = ?",
+        lambda g, u, day: (g, "casual"),
+    ),
+}
+
+
+def time_queries(path: str, ids_as, probe_user: int, days: int, reps: int) -> dict[str, float]:
+    probe_day = (date.today() - timedelta(days=days // 2)).isoformat()
+    conn = sqlite3.connect(path)
+    results = {}
+    for name, (sql, make_params) in QUERIES.items():
+        params = make_params(ids_as(GUILD), ids_as(probe_user), probe_day)
+        conn.execute(sql, params).fetchall()  # warm the page cache
+        start = time.perf_counter()
+        for _ in range(reps):
+            conn.execute(sql, params).fetchall()
+        results[name] = (time.perf_counter() - start) / reps * 1000
+    conn.close()
+    return results
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    daily_users = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    reps = 200
+    with tempfile.TemporaryDirectory() as tmp:
+        v1 = os.path.join(tmp, "v6.db")
+        v2 = os.path.join(tmp, "v7.db")
+        apply_migrations(v1, db.MIGRATIONS[:V2_STEP - 1])
+        probe = seed(v1, users, days, daily_users)
+        shutil.copyfile(v1, v2)
+        start = time.perf_counter()
+        apply_migrations(v2, db.MIGRATIONS[V2_STEP - 1:V2_STEP])
+        migrate_ms = (time.perf_counter() - start) * 1000
+        vacuum(v1)
+        vacuum(v2)
+        size_before, size_after = os.path.getsize(v1), os.path.getsize(v2)
+        tables_before, tables_after = table_sizes(v1), table_sizes(v2)
+        before = time_queries(v1, str, probe, days, reps)
+        after = time_queries(v2, int, probe, days, reps)
+
+    print(f"{users} users, {days} days x {daily_users} daily rows; migration took {migrate_ms:.0f}ms")
+    print(f"file size: {size_before / 1024:.0f} KiB -> {size_after / 1024:.0f} KiB "
+          f"({(1 - size_after / size_before) * 100:.1f}% smaller)")
+    if tables_before:
+        print(f"\n{'table / index':<40}{'v6 (KiB)':>12}{'v7 (KiB)':>12}")
+        for name in sorted(set(tables_before) | set(tables_after)):
+            b, a = tables_before.get(name, 0), tables_after.get(name, 0)
+            print(f"{name:<40}{b / 1024:>12.0f}{a / 1024:>12.0f}")
+    print(f"\n{'query (mean of ' + str(reps) + ')':<24}{'v6 (ms)':>12}{'v7 (ms)':>12}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<24}{before[name]:>12.4f}{after[name]:>12.4f}{before[name] / after[name]:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: the Turso wrapper (TursoConnection / TursoCursor) vs aiosqlite.
+
+Drives every public db.py helper (the bench_query_plans driver) through the
+aiosqlite path on a local file and through the Turso classes over
+fake_libsql at several simulated round-trip times, both pooled and with
+DB_POOL_SIZE=0 (a fresh TursoConnection, worker thread and connect request
+per call; the "/new" columns). RTT 0 isolates the wrapper's own cost: the
+worker thread hop, tuple conversion and the write lock. Prints mean latency and server round trips per helper call, then
+throughput for a whole driver pass and for the per-message hot path,
+sequential and with concurrent callers (background ledger and counter
+flushes that fire during a run are part of its cost).
+Usage: python benchmarks/bench_turso.py [rounds] [rtt_ms,...] [hot_ops]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import db  # noqa: E402
+import fake_libsql  # noqa: E402
+from bench_query_plans import DRIVER  # noqa: E402
+
+CONCURRENCY = 8
+
+
+async def hot_path(ops: int, workers: int) -> float:
+    """The per-message helpers (as in bench_pool), split across workers; returns ops/sec."""
+    async def worker(w: int):
+        for i in range(ops // workers):
+            uid = str(w * 50 + i % 50)
+            await db.get_state("1", f"user_last_msg_{uid}")
+            await db.set_state("1", "last_message_time", str(i))
+            await db.increment_chatter("1", uid, f"user{uid}")
+            await db.add_chips("1", uid, f"user{uid}", 1)
+            await db.get_balance("1", uid)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(workers)))
+    return (ops // workers) * workers * 5 / (time.perf_counter() - start)
+
+
+async def run(tmp: str, rtt_ms: float | None, fresh: bool, rounds: int, hot_ops: int) -> dict:
+    """One backend configuration; rtt_ms=None is aiosqlite, fresh means DB_POOL_SIZE=0."""
+    label = "sqlite" if rtt_ms is None else f"turso{rtt_ms:g}" + ("-new" if fresh else "")
+    path = os.path.join(tmp, f"{label}.db")
+    if rtt_ms is None:
+        db.configure("sqlite", path=path)
+    else:
+        fake_libsql.install(path)
+        fake_libsql.RTT_SECONDS = rtt_ms / 1000
+        db.configure("turso", url="libsql://bench", token="bench",
+                     journal=os.path.join(tmp, f"{label}.journal"))
+    if fresh:
+        db.POOL_SIZE = 0
+    await db.init()
+    for _, call in DRIVER:  # warm-up: first calls load caches and create rows
+        await call()
+
+    latency = {name: 0.0 for name, _ in DRIVER}
+    trips = {name: 0 for name, _ in DRIVER}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name, call in DRIVER:
+            before, t0 = fake_libsql.ROUND_TRIPS, time.perf_counter()
+            await call()
+            latency[name] += (time.perf_counter() - t0) * 1000
+            trips[name] += fake_libsql.ROUND_TRIPS - before
+    driver_rate = rounds * len(DRIVER) / (time.perf_counter() - start)
+
+    sequential = await hot_path(hot_ops, 1)
+    concurrent = await hot_path(hot_ops, CONCURRENCY)
+    await db.close()
+    return {
+        "latency": {name: ms / rounds for name, ms in latency.items()},
+        "trips": {name: n / rounds for name, n in trips.items()},
+        "driver": driver_rate,
+        "sequential": sequential,
+        "concurrent": concurrent,
+    }
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rtts = [float(x) for x in sys.argv[2].split(",")] if len(sys.argv) > 2 else [0, 5, 20]
+    hot_ops = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    configs = [(None, False)] + [(rtt, fresh) for rtt in rtts for fresh in (False, True)]
+    results = {}
+    # db.py logs with print(); keep the table readable
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        db.BACKUP_DIR = os.path.join(tmp, "backups")
+        for rtt, fresh in configs:
+            results[rtt, fresh] = asyncio.run(run(tmp, rtt, fresh, rounds, hot_ops))
+
+    names = ["aiosqlite"] + [f"{rtt:g}ms" + ("/new" if fresh else "") for rtt, fresh in configs[1:]]
+    turso = [results[rtts[0], fresh] for fresh in (False, True)] if rtts else []
+    print(f"mean ms per call over {rounds} rounds (warm caches); columns are Turso RTTs, "
+          f"/new = DB_POOL_SIZE=0; RT = server round trips per call")
+    header = (f"{'helper':<28}" + "".join(f"{n:>11}" for n in names)
+              + (f"{'RT':>6}{'RT/new':>8}" if turso else ""))
+    print(header)
+    print("-" * len(header))
+    for name, _ in DRIVER:
+        row = f"{name:<28}" + "".join(f"{results[c]['latency'][name]:>11.3f}" for c in configs)
+        if turso:
+            row += f"{turso[0]['trips'][name]:>6.1f}{turso[1]['trips'][name]:>8.1f}"
+        print(row)
+    print("-" * len(header))
+    for key, title in (("driver", "driver pass (calls/s)"), ("sequential", "hot path (ops/s)"),
+                       ("concurrent", f"hot path x{CONCURRENCY} (ops/s)")):
+        print(f"{title:<28}" + "".join(f"{results[c][key]:>11.0f}" for c in configs))
+    if rtts and rtts[0] == 0:
+        base, wrapped, fresh = results[None, False], results[0, False], results[0, True]
+        print(f"\nwrapper overhead at 0ms RTT: driver pass {base['driver'] / wrapped['driver']:.2f}x slower, "
+              f"hot path {base['sequential'] / wrapped['sequential']:.2f}x slower")
+        print(f"fresh connection per call at 0ms RTT: driver pass {wrapped['driver'] / fresh['driver']:.2f}x "
+              f"slower than pooled, hot path {wrapped['sequential'] / fresh['sequential']:.2f}x slower")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Stand-in for the libsql_experimental driver, backed by a local SQLite file.
+
+install(path) registers it as libsql_experimental so db.configure("turso")
+runs offline against that file. Set ONLINE = False to simulate an
+unreachable server: every call then fails the way a dropped network does.
+connect(path, sync_url=...) returns an embedded replica whose sync() copies
+the primary file, like a libsql replica pulling new frames.
+Set RTT_SECONDS to add a simulated network round trip to every request
+(connect, execute, executemany, executescript, commit, rollback, sync);
+ROUND_TRIPS counts the requests made.
+Set STALL = "request" to hang requests before they reach the server, or
+STALL = "reply" to apply them and then hang before answering (a commit
+that landed but whose reply was lost); STALL_OPS limits it to some
+operations, e.g. {"commit"}. Stalled calls finish once STALL is None again.
+"""
+
+import sys
+import time
+import types
+import sqlite3
+
+ONLINE = True
+PRIMARY_PATH: str | None = None
+RTT_SECONDS = 0.0
+ROUND_TRIPS = 0
+STALL: str | None = None
+STALL_OPS: set[str] | None = None
+
+
+def _check():
+    if not ONLINE:
+        raise ValueError("Hrana: error sending request: connection refused")
+
+
+def _stall(point: str, op: str):
+    while STALL == point and (STALL_OPS is None or op in STALL_OPS):
+        time.sleep(0.01)
+
+
+def _round_trip(op: str):
+    """One request to the server: fails when offline, otherwise costs an RTT."""
+    global ROUND_TRIPS
+    _check()
+    _stall("request", op)
+    ROUND_TRIPS += 1
+    if RTT_SECONDS > 0:
+        time.sleep(RTT_SECONDS)
+
+
+class Cursor:
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def fetchall(self):
+        _check()
+        return self._cursor.fetchall()
+
+
+class Connection:
+    def __init__(self):
+        _round_trip("connect")
+        self._conn = sqlite3.connect(PRIMARY_PATH, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL").fetchall()
+
+    def execute(self, sql, params=()):
+        _round_trip("execute")
+        cursor = Cursor(self._conn.execute(sql, params))
+        _stall("reply", "execute")
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        _round_trip("executemany")
+        cursor = Cursor(self._conn.executemany(sql, seq_of_params))
+        _stall("reply", "executemany")
+        return cursor
+
+    def executescript(self, sql):
+        _round_trip("executescript")
+        cursor = Cursor(self._conn.executescript(sql))
+        _stall("reply", "executescript")
+        return cursor
+
+    def commit(self):
+        _round_trip("commit")
+        self._conn.commit()
+        _stall("reply", "commit")
+
+    def rollback(self):
+        if ONLINE:  # rolling back a dead stream is a local no-op, never an error
+            _round_trip("rollback")
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class Replica:
+    def __init__(self, path: str):
+        self._path = path
+
+    def sync(self):
+        _round_trip("sync")
+        src = sqlite3.connect(PRIMARY_PATH, timeout=5)
+        dst = sqlite3.connect(self._path, timeout=5)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def close(self):
+        pass
+
+
+def connect(url, auth_token=None, sync_url=None):
+    return Replica(url) if sync_url else Connection()
+
+
+def install(path: str):
+    global PRIMARY_PATH
+    PRIMARY_PATH = path
+    module = types.ModuleType("libsql_experimental")
+    module.connect = connect
+    sys.modules["libsql_experimental"] = module
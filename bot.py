@@ -15,6 +15,7 @@ from zoneinfo import ZoneInfo
 from typing import Optional
 import os
 import shlex
+import signal
 import yaml
 from pathlib import Path
 from collections import deque
@@ -44,7 +45,36 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+class CrispsBot(commands.Bot):
+    async def setup_hook(self):
+        # Runs once, before the gateway connects: discord.py can dispatch
+        # on_message / on_voice_state_update before on_ready (and on_ready
+        # fires again on every reconnect), so the database must be up first
+        db.configure()
+        await db.init()
+        # The Procfile worker is stopped with SIGTERM on every restart and deploy;
+        # close like Ctrl+C does so start() returns and the DB buffers get flushed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except NotImplementedError:
+            pass  # Windows event loops have no signal handlers
+
+    def _on_sigterm(self):
+        print("[BOT] SIGTERM received, shutting down")
+        self._sigterm_task = asyncio.create_task(self.close())
+
+    async def start(self, *args, **kwargs):
+        try:
+            await super().start(*args, **kwargs)
+        finally:
+            # Flush buffered counters and chip-ledger entries, then release pooled
+            # connections so their threads exit. Done here rather than in close()
+            # because bot.run() awaits start(); a close() task is cancelled on exit.
+            await db.close()
+
+
+bot = CrispsBot(command_prefix="!", intents=intents)
 
 def load_yaml(filename):
     with open(Path(__file__).parent / "config" / filename, "r", encoding="utf-8") as f:
@@ -788,7 +818,7 @@ async def do_chatter_rewards(guild_id: str):
     for i, user in enumerate(chatters):
         if i >= 3:
             break
-        await db.add_chips(guild_id, user["user_id"], user["username"], rewards[i])
+        await db.add_chips(guild_id, user["user_id"], user["username"], rewards[i], source="chatter_reward")
         lines.append(
             msg_templates[i].format(
                 user=f"<@{user['user_id']}>",
@@ -842,7 +872,7 @@ async def do_activity_rewards(guild_id: str):
     for i, user in enumerate(top_activity):
         if i >= 3:
             break
-        await db.add_chips(guild_id, user["user_id"], user["username"], rewards[i])
+        await db.add_chips(guild_id, user["user_id"], user["username"], rewards[i], source="activity_reward")
         lines.append(
             msg_templates[i].format(
                 user=f"<@{user['user_id']}>",
@@ -887,6 +917,39 @@ async def before_vc_watchdog():
     await asyncio.sleep(10)  # Let channel cache settle after ready
 
 
+@tasks.loop(hours=config.MAINTENANCE["interval_hours"])
+async def maintenance_loop():
+    """Prune old rows and compact the database file."""
+    active_vc = {
+        str(guild.id): {str(m.id) for vc in guild.voice_channels for m in vc.members}
+        for guild in bot.guilds
+    }
+    try:
+        await db.run_maintenance(config.MAINTENANCE["retention_days"], active_vc)
+    except Exception as e:
+        print(f"[Maintenance] Failed: {e}")
+
+
+@maintenance_loop.before_loop
+async def before_maintenance_loop():
+    await bot.wait_until_ready()
+    await asyncio.sleep(300)  # Stay out of the way of startup work
+
+
+@tasks.loop(hours=config.BACKUPS["interval_hours"])
+async def backup_loop():
+    """Take a scheduled snapshot of the local database."""
+    try:
+        await db.create_backup(config.BACKUPS["keep"])
+    except Exception as e:
+        print(f"[Backup] Failed: {e}")
+
+
+@backup_loop.before_loop
+async def before_backup_loop():
+    await bot.wait_until_ready()
+
+
 @tasks.loop(seconds=60)
 async def schedule_loop():
     """Main schedule loop — checks daily questions and chatter every minute."""
@@ -1294,6 +1357,64 @@ async def autojoin_cmd(interaction: discord.Interaction):
     )
 
 
+@bot.tree.command(name="backup", description="Snapshot the bot database now (admin)")
+@app_commands.default_permissions(administrator=True)
+async def backup_cmd(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        report = await db.create_backup(config.BACKUPS["keep"])
+    except Exception as e:
+        await interaction.followup.send(f"❌ Backup failed: `{e}`", ephemeral=True)
+        return
+    await interaction.followup.send(
+        f"✅ Saved `{os.path.basename(report['path'])}` "
+        f"({report['bytes'] / 1024:.0f} KiB, {report['elapsed_ms']:.0f} ms)\n"
+        f"-# Keeping the newest {config.BACKUPS['keep']}; rotated out {len(report['rotated'])}.",
+        ephemeral=True,
+    )
+
+
+@bot.tree.command(name="restorebackup", description="Replace the bot database with a snapshot (admin)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(name="Snapshot file name (leave empty to list snapshots)")
+async def restorebackup_cmd(interaction: discord.Interaction, name: Optional[str] = None):
+    await interaction.response.defer(ephemeral=True)
+    snapshots = {os.path.basename(p): p for p in db.list_backups()}
+    if not name or name not in snapshots:
+        listing = "\n".join(f"`{n}`" for n in list(snapshots)[:10]) or "No snapshots yet."
+        prefix = f"❌ No snapshot named `{name}`.\n" if name else ""
+        await interaction.followup.send(f"{prefix}Snapshots (newest first):\n{listing}", ephemeral=True)
+        return
+    try:
+        report = await db.restore_backup(snapshots[name])
+    except Exception as e:
+        await interaction.followup.send(f"❌ Restore failed: `{e}`", ephemeral=True)
+        return
+    await interaction.followup.send(
+        f"✅ Restored `{name}` (schema v{report['schema_version']}, {report['elapsed_ms']:.0f} ms)",
+        ephemeral=True,
+    )
+
+
+@bot.tree.command(name="vacuumdb", description="One-time VACUUM so maintenance can free disk space (admin)")
+@app_commands.default_permissions(administrator=True)
+async def vacuumdb_cmd(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        report = await db.convert_auto_vacuum()
+    except Exception as e:
+        await interaction.followup.send(f"❌ Vacuum failed: `{e}`", ephemeral=True)
+        return
+    if not report["converted"]:
+        await interaction.followup.send("✅ Already using incremental vacuum; nothing to do.", ephemeral=True)
+        return
+    await interaction.followup.send(
+        f"✅ Converted to incremental vacuum: {report['bytes_before'] / 1024:.0f} KiB → "
+        f"{report['bytes_after'] / 1024:.0f} KiB ({report['elapsed_ms']:.0f} ms)",
+        ephemeral=True,
+    )
+
+
 @bot.tree.command(name="sync", description="Force re-sync slash commands to this server (admin)")
 @app_commands.default_permissions(administrator=True)
 async def sync_cmd(interaction: discord.Interaction):
@@ -1567,21 +1688,21 @@ async def donate_cmd(interaction: discord.Interaction, user: discord.Member, amo
     # Defer before DB calls
     await interaction.response.defer()
     
-    # Check donor's balance
-    donor_balance = await db.get_balance(gid, donor_uid)
-    if amount > donor_balance:
+    # Transfer chips (nothing changes if the donor can't cover it)
+    result = await db.transfer_chips(
+        gid, donor_uid, interaction.user.display_name, recipient_uid, user.display_name, amount
+    )
+    if not result["ok"]:
         await interaction.followup.send(
-            f"❌ You don't have enough chips! You have **{fmt_num(donor_balance)}** {emoji}",
+            f"❌ You don't have enough chips! You have **{fmt_num(result['sender_balance'])}** {emoji}",
             ephemeral=True
         )
         return
     
-    # Transfer chips
-    await db.add_chips(gid, donor_uid, interaction.user.display_name, -amount)
-    await db.add_chips(gid, recipient_uid, user.display_name, amount)
-    
     await interaction.followup.send(
-        f"🎁 {interaction.user.mention} donated **+{fmt_num(amount)}** {emoji} to {user.mention}!"
+        f"🎁 {interaction.user.mention} donated **+{fmt_num(amount)}** {emoji} to {user.mention}!\n"
+        f"-# {interaction.user.display_name}: {fmt_num(result['sender_balance'])} {emoji} · "
+        f"{user.display_name}: {fmt_num(result['recipient_balance'])} {emoji}"
     )
 
 
@@ -1668,7 +1789,40 @@ async def botstats_cmd(interaction: discord.Interaction):
         f"Total Ops: `{fmt_num(total_ops)}`"
     )
     embed.add_field(name="Database Load", value=db_value, inline=False)
-    
+
+    cache = db_stats["state_cache"]
+    lookups = cache["hits"] + cache["misses"]
+    hit_rate = (cache["hits"] / lookups * 100) if lookups else 0.0
+    cache_value = (
+        f"Hits: `{fmt_num(cache['hits'])}`\n"
+        f"Misses: `{fmt_num(cache['misses'])}`\n"
+        f"Hit Rate: `{hit_rate:.1f}%`"
+    )
+    embed.add_field(name="State Cache", value=cache_value, inline=False)
+
+    if "pool" in db_stats:
+        pool = db_stats["pool"]
+        pool_value = (
+            f"Reuse Rate: `{pool['reuse_rate'] * 100:.1f}%`\n"
+            f"Opened: `{fmt_num(pool['opened'])}`\n"
+            f"Reconnects: `{fmt_num(pool['reconnects'])}`"
+        )
+        if "turso" in db_stats:
+            turso = db_stats["turso"]
+            pool_value += (
+                f"\nStream Reconnects: `{fmt_num(turso['stream_reconnects'])}`\n"
+                f"Keep-alive Pings: `{fmt_num(pool['keepalive_pings'])}`"
+            )
+        embed.add_field(name="Connections", value=pool_value, inline=False)
+
+    latency_lines = [
+        f"`{name}` ×{fmt_num(h['count'])}: `{h['p50']:.1f}` / `{h['p95']:.1f}` / `{h['p99']:.1f}` ms"
+        for name, h in db.get_latency_report(5)
+    ]
+    if latency_lines:
+        latency_lines.append(f"Slow queries logged: `{len(db_stats['slow_queries'])}`")
+        embed.add_field(name="Query Latency (p50 / p95 / p99)", value="\n".join(latency_lines), inline=False)
+
     embed.set_footer(text=f"Avg Load: {ops_per_min:.2f} ops/min")
     
     await interaction.followup.send(embed=embed)
@@ -1686,6 +1840,58 @@ async def chips_cmd(interaction: discord.Interaction, user: discord.Member, amou
     )
 
 
+@bot.tree.command(name="grantchips", description="Give chips to everyone with a role (admin only)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(role="Role to grant to (leave empty for every member)", amount="Chips per member (negative to take)")
+async def grantchips_cmd(interaction: discord.Interaction, amount: int, role: Optional[discord.Role] = None):
+    await interaction.response.defer(ephemeral=True)
+
+    members = role.members if role else interaction.guild.members
+    usernames = {str(m.id): m.display_name for m in members if not m.bot}
+    report = await db.bulk_add_chips(str(interaction.guild_id), usernames, amount)
+    target = role.mention if role else "everyone"
+    await interaction.followup.send(
+        f"Gave **{fmt_num(amount)} {config.CHIPS['emoji']}** to {target}: "
+        f"**{fmt_num(report['rows'])}** members updated in {report['elapsed_ms']:.0f} ms",
+        ephemeral=True,
+    )
+
+
+@bot.tree.command(name="decaychips", description="Shrink every balance by a percentage (admin only)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(percent="Percent of each balance to remove", min_balance="Balances are never decayed below this")
+async def decaychips_cmd(interaction: discord.Interaction, percent: app_commands.Range[float, 0, 100], min_balance: int = 0):
+    await interaction.response.defer(ephemeral=True)
+
+    report = await db.bulk_decay_chips(str(interaction.guild_id), percent, min_balance)
+    await interaction.followup.send(
+        f"Decayed balances by **{percent:g}%** (floor {fmt_num(min_balance)}): "
+        f"**{fmt_num(report['rows'])}** members, {fmt_num(-report['chips'])} {config.CHIPS['emoji']} removed "
+        f"in {report['elapsed_ms']:.0f} ms",
+        ephemeral=True,
+    )
+
+
+@bot.tree.command(name="resetchips", description="Season reset: set every balance to the same amount (admin only)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(amount="New balance for everyone", confirm="Must be True to actually reset")
+async def resetchips_cmd(interaction: discord.Interaction, amount: int = 0, confirm: bool = False):
+    if not confirm:
+        await interaction.response.send_message(
+            f"This sets **every** balance to {fmt_num(amount)}. Run again with `confirm: True` to do it.",
+            ephemeral=True,
+        )
+        return
+    await interaction.response.defer(ephemeral=True)
+
+    report = await db.bulk_set_chips(str(interaction.guild_id), amount)
+    await interaction.followup.send(
+        f"Reset balances to **{fmt_num(amount)} {config.CHIPS['emoji']}**: "
+        f"**{fmt_num(report['rows'])}** members changed in {report['elapsed_ms']:.0f} ms",
+        ephemeral=True,
+    )
+
+
 # @bot.tree.command(name="codepurple", description="Force a Code Purple message (admin only)")
 # @app_commands.default_permissions(administrator=True)
 # async def codepurple_cmd(interaction: discord.Interaction):
@@ -1827,7 +2033,7 @@ class BetModal(discord.ui.Modal, title="Place Your Bet!"):
             return
         
         # Deduct bet and start game
-        await db.add_chips(gid, uid, interaction.user.display_name, -bet)
+        await db.add_chips(gid, uid, interaction.user.display_name, -bet, source=self.game_type)
         
         if self.game_type == "higher_lower":
             await start_higher_lower(interaction, bet, use_followup=True)
@@ -1913,7 +2119,7 @@ class PlayAgainView(discord.ui.View):
             )
             return
         
-        await db.add_chips(gid, uid, interaction.user.display_name, -self.bet)
+        await db.add_chips(gid, uid, interaction.user.display_name, -self.bet, source=self.game_type)
         self.disable_all()
         await interaction.edit_original_response(view=self)
         
@@ -2034,8 +2240,7 @@ class HigherLowerView(discord.ui.View):
             if game["streak"] >= 4:
                 multiplier = hl_multiplier(game["streak"])
                 winnings = int(game["bet"] * multiplier)
-                await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings)
-                new_balance = await db.get_balance(self.gid, self.uid)
+                new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings, source="higher_lower")
                 profit = winnings - game["bet"]
                 
                 embed = discord.Embed(
@@ -2056,9 +2261,9 @@ class HigherLowerView(discord.ui.View):
                 loss = game["bet"] - refund
                 
                 if refund > 0:
-                    await db.add_chips(self.gid, self.uid, interaction.user.display_name, refund)
-                
-                new_balance = await db.get_balance(self.gid, self.uid)
+                    new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, refund, source="higher_lower")
+                else:
+                    new_balance = await db.get_balance(self.gid, self.uid)
                 
                 embed = discord.Embed(
                     title="🎴 Higher or Lower — Busted! ✗",
@@ -2342,8 +2547,7 @@ class VideoPokerHoldView(discord.ui.View):
         if multiplier > 0:
             # Winner!
             winnings = int(game["bet"] * multiplier)
-            await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings)
-            new_balance = await db.get_balance(self.gid, self.uid)
+            new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings, source="video_poker")
             profit = winnings - game["bet"]
             
             embed = discord.Embed(
@@ -2716,8 +2920,7 @@ class ShutTheBoxView(discord.ui.View):
         if not game["tiles"]:
             del _active_games[(self.gid, self.uid)]
             winnings = game["bet"] * SHUT_THE_BOX_PAYOUT
-            await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings)
-            new_balance = await db.get_balance(self.gid, self.uid)
+            new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings, source="shut_the_box")
             profit = winnings - game["bet"]
             
             embed = discord.Embed(
@@ -2838,8 +3041,7 @@ async def start_blackjack(interaction: discord.Interaction, bet: int, use_follow
         
         if player_bj and dealer_bj:
             # Push - return bet
-            await db.add_chips(gid, uid, interaction.user.display_name, bet)
-            new_balance = await db.get_balance(gid, uid)
+            new_balance = await db.add_chips(gid, uid, interaction.user.display_name, bet, source="blackjack")
             
             embed = discord.Embed(
                 title="🃏 Blackjack — Push!",
@@ -2856,8 +3058,7 @@ async def start_blackjack(interaction: discord.Interaction, bet: int, use_follow
         elif player_bj:
             # Player blackjack - 2.5x payout
             winnings = int(bet * 2.5)
-            await db.add_chips(gid, uid, interaction.user.display_name, winnings)
-            new_balance = await db.get_balance(gid, uid)
+            new_balance = await db.add_chips(gid, uid, interaction.user.display_name, winnings, source="blackjack")
             profit = winnings - bet
             
             embed = discord.Embed(
@@ -2983,8 +3184,7 @@ class BlackjackView(discord.ui.View):
         if dealer_value > 21:
             # Dealer busts - player wins
             winnings = game["bet"] * 2
-            await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings)
-            new_balance = await db.get_balance(self.gid, self.uid)
+            new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings, source="blackjack")
             profit = winnings - game["bet"]
             
             embed = discord.Embed(
@@ -3001,8 +3201,7 @@ class BlackjackView(discord.ui.View):
         elif player_value > dealer_value:
             # Player wins
             winnings = game["bet"] * 2
-            await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings)
-            new_balance = await db.get_balance(self.gid, self.uid)
+            new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, winnings, source="blackjack")
             profit = winnings - game["bet"]
             
             embed = discord.Embed(
@@ -3033,8 +3232,7 @@ class BlackjackView(discord.ui.View):
             )
         else:
             # Push (tie)
-            await db.add_chips(self.gid, self.uid, interaction.user.display_name, game["bet"])
-            new_balance = await db.get_balance(self.gid, self.uid)
+            new_balance = await db.add_chips(self.gid, self.uid, interaction.user.display_name, game["bet"], source="blackjack")
             
             embed = discord.Embed(
                 title="🃏 Blackjack — Push!",
@@ -3119,7 +3317,7 @@ class BlackjackView(discord.ui.View):
             return
         
         # Deduct additional bet
-        await db.add_chips(self.gid, self.uid, interaction.user.display_name, -game["bet"])
+        await db.add_chips(self.gid, self.uid, interaction.user.display_name, -game["bet"], source="blackjack")
         game["bet"] *= 2
         game["doubled"] = True
         
@@ -3238,13 +3436,15 @@ _SCRAPE_PAUSE       = 1.5   # seconds between channels (courtesy headroom on top
 async def on_ready():
     if not hasattr(bot, "_initialized"):
         bot._initialized = True
-        await db.init()
         bot.add_view(WordGameActiveView())
         bot.add_view(WordGameStartView())
         bot.add_view(NewQuestionView("casual"))
         bot.add_view(NewQuestionView("typology"))
         schedule_loop.start()
         vc_watchdog.start()
+        maintenance_loop.start()
+        if config.BACKUPS["enabled"] and not db.USE_TURSO:
+            backup_loop.start()
         bot.loop.create_task(chip_drop_cycle())
         # Guild-only sync — instant visibility, no 1-hour global propagation delay.
         # Global bot.tree.sync() is intentionally omitted: it creates a pending global
@@ -3535,32 +3735,10 @@ async def on_message(message: discord.Message):
         await message.channel.send(embed=dnd.build_wallet_embed(inventories))
         return
 
-    # 1. Consolidated Activity Tracking
+    # 1. Consolidated Activity Tracking (spam check + last message state + reward counters)
+    now_iso = datetime.now(timezone.utc).isoformat()
     try:
-        now = datetime.now(timezone.utc)
-        now_iso = now.isoformat()
-        last_msg_key = f"user_last_msg_{uid}"
-        
-        # Batch read previous states
-        states = await db.get_states(gid, [last_msg_key])
-        prev_msg_time = states.get(last_msg_key)
-        
-        is_spam = False
-        if prev_msg_time:
-            last_dt = datetime.fromisoformat(prev_msg_time).replace(tzinfo=timezone.utc)
-            if (now - last_dt).total_seconds() < 3:
-                is_spam = True
-        
-        # Batch write tracking updates
-        await db.set_states(gid, {
-            "last_message_time": now_iso,
-            "last_message_channel": str(message.channel.id),
-            last_msg_key: now_iso
-        })
-        
-        if not is_spam:
-            await db.increment_chatter(gid, uid, message.author.display_name)
-            await db.increment_activity_message(gid, uid, message.author.display_name)
+        await db.record_message(gid, uid, message.author.display_name, str(message.channel.id))
     except Exception as e:
         print(f"[on_message] DB error tracking activity: {e}")
 
@@ -3862,13 +4040,16 @@ async def on_message(message: discord.Message):
                 pass
         return
 
+    # Only channels with a live chip drop or word game need the lookups below
+    interesting = db.is_interesting_channel(gid, str(message.channel.id))
+
     # --- Chip Drop handling (grab or math answer) ---
-    drop = await db.get_chip_drop(gid)
+    drop = await db.get_chip_drop(gid) if interesting else None
     if drop and str(message.channel.id) == drop["channel_id"]:
         content = message.content.strip()
         if (drop["drop_type"] == "grab" and content.lower() == "~grab") or \
            (drop["drop_type"] == "math" and content.replace(",", "") == drop["answer"]):
-            await db.add_chips(gid, uid, message.author.display_name, drop["amount"])
+            await db.add_chips(gid, uid, message.author.display_name, drop["amount"], source="chip_drop")
             await message.reply(random.choice(config.MESSAGES["chip_drop"]["claimed"]).format(user=message.author.mention, amount=fmt_num(drop["amount"]), emoji=config.CHIPS["emoji"]), mention_author=False)
             await db.delete_chip_drop(gid)
             await db.set_state(gid, "last_chip_drop_claimed", now_iso)
@@ -3881,7 +4062,7 @@ async def on_message(message: discord.Message):
             await db.set_state(gid, "chip_drop_cooldown_hours", str(cooldown_hours))
 
     # Word game — every message in the game channel adds a word
-    game = await db.get_word_game(gid)
+    game = await db.get_word_game(gid) if interesting else None
     if game and game["active"] and str(message.channel.id) == game["channel_id"]:
         word = message.content.strip()
         valid = word and " " not in word and "\n" not in word and len(word) <= 45 and \
@@ -61,6 +61,25 @@ LEADERBOARD = {
     "page_size": 10,
 }
 
+# Database housekeeping: retention in days per table (None = keep forever)
+MAINTENANCE = {
+    "interval_hours": 24,
+    "retention_days": {
+        "daily_chatter": 14,
+        "daily_activity": 14,
+        "question_usage": None,  # keep: pruning makes used questions eligible again
+        "vc_sessions": 1,
+        "chip_ledger": 30,
+    },
+}
+
+# Compressed snapshots of the local database (ignored on Turso)
+BACKUPS = {
+    "enabled": True,
+    "interval_hours": 24,
+    "keep": 7,
+}
+
 # ==================== EMBED CONFIG ====================
 
 AUTHOR_NAME = ""
@@ -1,29 +1,118 @@
 """
-Database layer - Turso (cloud) or SQLite (local fallback)
-Uses libsql for Turso, aiosqlite for local development
+Database layer - Turso (cloud), SQLite (local fallback) or in-memory SQLite
+Uses libsql for Turso, aiosqlite for local development; see configure()
 """
 
 import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import sqlite3
+import math
+import time
+import queue
 import asyncio
-from datetime import datetime, timezone
-from contextlib import asynccontextmanager
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from contextlib import AsyncExitStack, asynccontextmanager
 from zoneinfo import ZoneInfo
 
 # Use Manila timezone for date tracking (must match bot.py)
 MANILA_TZ = ZoneInfo("Asia/Manila")
 
-# Check for Turso configuration
-TURSO_URL = os.environ.get("TURSO_DATABASE_URL")
-TURSO_TOKEN = os.environ.get("TURSO_AUTH_TOKEN")
-USE_TURSO = bool(TURSO_URL and TURSO_TOKEN)
+# ==================== BACKEND ====================
+
+# "sqlite" (local file), "memory" (shared-cache in-memory SQLite, for tests and
+# benchmarks) or "turso". Nothing is selected, imported or opened until
+# configure() is called.
+BACKENDS = ("sqlite", "memory", "turso")
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_data.db")
+
+BACKEND: str | None = None
+USE_TURSO = False
+DB_PATH = DEFAULT_DB_PATH
+TURSO_URL: str | None = None
+TURSO_TOKEN: str | None = None
+# Driver modules, imported by configure()
+aiosqlite = None
+libsql = None
+
+# Plain sqlite3 connection that keeps the shared in-memory database alive
+# while pooled connections come and go
+_memory_anchor: sqlite3.Connection | None = None
+
+
+def configure(backend: str | None = None, *, path: str | None = None,
+              url: str | None = None, token: str | None = None, name: str = "crisps",
+              replica: str | None = None, journal: str | None = None):
+    """Select the database backend for this process.
+
+    With no backend, Turso is used when TURSO_DATABASE_URL and
+    TURSO_AUTH_TOKEN are set, local SQLite otherwise. path overrides the
+    SQLite file, name picks the in-memory database (each name is a separate
+    database). replica (or DB_REPLICA_PATH) is a local file that serves
+    read-mostly helpers, see READ REPLICA. journal (or DB_JOURNAL_PATH)
+    overrides where Turso writes are kept while the server is unreachable,
+    see WRITE JOURNAL.
+
+    One backend is active per process at a time: the pool, caches and
+    buffers are module state. To compare backends, close() and configure()
+    the next one (as the benchmarks do); every setting and cache from the
+    previous backend is reset here. In-memory data lives until the next
+    configure() call.
+    """
+    global BACKEND, USE_TURSO, DB_PATH, TURSO_URL, TURSO_TOKEN, POOL_SIZE, _memory_anchor
+    global REPLICA_PATH, JOURNAL_PATH, aiosqlite, libsql
+    if _pool is not None:
+        raise RuntimeError("db.close() the current backend before reconfiguring")
+    url = url or os.environ.get("TURSO_DATABASE_URL")
+    token = token or os.environ.get("TURSO_AUTH_TOKEN")
+    if backend is None:
+        backend = "turso" if url and token else "sqlite"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown database backend {backend!r} (expected one of {BACKENDS})")
+
+    if _memory_anchor is not None:
+        _memory_anchor.close()
+        _memory_anchor = None
+    # Nothing cached from the previous database may leak into this one
+    for cache in (_state_cache, _rank_caches, _chip_drops, _word_games, _interesting_channels):
+        cache.clear()
+    TURSO_URL = TURSO_TOKEN = None
+    POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "2" if backend == "turso" else "4"))
+
+    if backend == "turso":
+        if not (url and token):
+            raise ValueError("The turso backend needs a database URL and auth token")
+        import libsql_experimental as libsql  # type: ignore - installed in production only
+        TURSO_URL, TURSO_TOKEN = url, token
+        JOURNAL_PATH = journal or os.environ.get("DB_JOURNAL_PATH") or DEFAULT_JOURNAL_PATH
+        print(f"[DB] Using Turso cloud database")
+    else:
+        import aiosqlite
+        JOURNAL_PATH = None  # Local databases have nothing to fall back from
+        if backend == "memory":
+            DB_PATH = f"file:{name}?mode=memory&cache=shared"
+            _memory_anchor = sqlite3.connect(DB_PATH, uri=True, check_same_thread=False)
+            print(f"[DB] Using in-memory SQLite: {name}")
+        else:
+            DB_PATH = path or DEFAULT_DB_PATH
+            print(f"[DB] Using local SQLite: {DB_PATH}")
+    REPLICA_PATH = replica or os.environ.get("DB_REPLICA_PATH") or None
+    if REPLICA_PATH is not None:
+        if backend != "turso" and os.path.abspath(REPLICA_PATH) == os.path.abspath(DB_PATH):
+            raise ValueError("The read replica must be a different file from the primary")
+        import aiosqlite  # Replica reads are always local
+        print(f"[DB] Using read replica: {REPLICA_PATH}")
+    BACKEND = backend
+    USE_TURSO = backend == "turso"
 
-if USE_TURSO:
-    import libsql_experimental as libsql  # type: ignore - installed in production only
-    print(f"[DB] Using Turso cloud database")
-else:
-    import aiosqlite
-    DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_data.db")
-    print(f"[DB] Using local SQLite: {DB_PATH}")
 
 # ===================
 METRICS = {
@@ -34,7 +123,144 @@ METRICS = {
 
 def get_db_stats():
     """Return a copy of the current DB metrics."""
-    return METRICS.copy()
+    stats = METRICS.copy()
+    stats["backend"] = BACKEND
+    if _pool is not None:
+        pool = _pool.stats.copy()
+        checkouts = pool["reused"] + pool["opened"]
+        pool["reuse_rate"] = pool["reused"] / checkouts if checkouts else 0.0
+        stats["pool"] = pool
+    if USE_TURSO:
+        stats["turso"] = TURSO_STATS.copy()
+    stats["state_cache"] = STATE_CACHE_STATS.copy()
+    stats["latency"] = {name: h.summary() for name, h in QUERY_LATENCY.items()}
+    stats["waits"] = {name: h.summary() for name, h in WAIT_LATENCY.items()}
+    stats["slow_queries"] = list(SLOW_QUERIES)
+    if LAST_MAINTENANCE:
+        stats["maintenance"] = LAST_MAINTENANCE.copy()
+    if REPLICA_PATH is not None:
+        stats["replica"] = {**REPLICA_STATS, "pinned": len(_pinned), "writes_behind": _write_gen - max(_synced_gen, 0)}
+    if JOURNAL_PATH is not None:
+        stats["journal"] = {**JOURNAL_STATS, "degraded": _degraded, "pending_bytes": _journal_size() - _replay_offset}
+    return stats
+
+# ==================== QUERY TIMING ====================
+
+# Statements slower than this (ms) go into the slow-query ring buffer
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = 50
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets (~12% wide) from 10us to ~2min, in milliseconds."""
+    FIRST = 0.01
+    GROWTH = 1.12
+    BUCKETS = 145
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        if ms <= self.FIRST:
+            i = 0
+        else:
+            i = min(int(math.log(ms / self.FIRST, self.GROWTH)) + 1, self.BUCKETS - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """Upper edge of the bucket holding the p-th percentile (capped at max)."""
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self.FIRST * self.GROWTH ** i, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max, 3),
+        }
+
+
+# Keyed by the db.py function that issued the statement
+QUERY_LATENCY: dict[str, LatencyHistogram] = {}
+# Time spent queued before a connection was available to run the statement
+WAIT_LATENCY: dict[str, LatencyHistogram] = {}
+SLOW_QUERIES: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+# Plumbing between the helpers and the driver; never reported as the caller
+_TIMING_SKIP = frozenset({
+    "execute", "executemany", "executescript", "commit", "rollback", "submit",
+    "run", "batch", "get_connection", "reader", "writer", "<genexpr>", "run_batch", "wait",
+})
+
+
+def _caller() -> str:
+    """Name of the nearest db.py helper on the stack."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == __file__ and code.co_name not in _TIMING_SKIP:
+            return code.co_name
+        frame = frame.f_back
+    return "<external>"
+
+
+def _param_shape(params) -> str:
+    """Parameter types only - values are never logged."""
+    if not params:
+        return "()"
+    return "(" + ", ".join(type(p).__name__ for p in params) + ")"
+
+
+def _record_wait(name: str, ms: float):
+    hist = WAIT_LATENCY.get(name)
+    if hist is None:
+        hist = WAIT_LATENCY[name] = LatencyHistogram()
+    hist.record(ms)
+
+
+def _record_query(caller: str, sql: str, shape: str, start: float):
+    ms = (time.perf_counter() - start) * 1000
+    hist = QUERY_LATENCY.get(caller)
+    if hist is None:
+        hist = QUERY_LATENCY[caller] = LatencyHistogram()
+    hist.record(ms)
+    if ms >= SLOW_QUERY_MS:
+        SLOW_QUERIES.append({
+            "caller": caller,
+            "ms": round(ms, 3),
+            "sql": " ".join(sql.split())[:200],
+            "params": shape,
+            "at": datetime.now(timezone.utc).isoformat(),
+        })
+
+
+def get_latency_report(limit: int = 5) -> list[tuple[str, dict]]:
+    """The helpers with the most total query time, slowest first."""
+    ranked = sorted(QUERY_LATENCY.items(), key=lambda item: item[1].total, reverse=True)
+    return [(name, hist.summary()) for name, hist in ranked[:limit]]
+
+
+def reset_latency_stats():
+    QUERY_LATENCY.clear()
+    WAIT_LATENCY.clear()
+    SLOW_QUERIES.clear()
 
 # ==================== CONNECTION WRAPPER ====================
 
@@ -45,97 +271,1344 @@ class MetricsqliteConnection:
 
     async def execute(self, sql, params=None):
         METRICS["queries"] += 1
-        return await self._conn.execute(sql, params or [])
+        caller, start = _caller(), time.perf_counter()
+        try:
+            return await self._conn.execute(sql, params or [])
+        finally:
+            _record_query(caller, sql, _param_shape(params), start)
+
+    async def executemany(self, sql, seq_of_params):
+        METRICS["queries"] += 1
+        seq_of_params = list(seq_of_params)
+        caller, start = _caller(), time.perf_counter()
+        try:
+            return await self._conn.executemany(sql, seq_of_params)
+        finally:
+            shape = f"{len(seq_of_params)} x {_param_shape(seq_of_params[0] if seq_of_params else ())}"
+            _record_query(caller, sql, shape, start)
 
     async def executescript(self, sql):
         METRICS["scripts"] += 1
-        return await self._conn.executescript(sql)
+        caller, start = _caller(), time.perf_counter()
+        try:
+            return await self._conn.executescript(sql)
+        finally:
+            _record_query(caller, sql, "script", start)
 
     async def commit(self):
         METRICS["commits"] += 1
-        return await self._conn.commit()
+        caller, start = _caller(), time.perf_counter()
+        try:
+            return await self._conn.commit()
+        finally:
+            _record_query(caller, "COMMIT", "()", start)
+
+    async def rollback(self):
+        return await self._conn.rollback()
+
+    async def ping(self):
+        await self._conn.execute("SELECT 1")
 
     async def close(self):
-        return await self._conn.close()
+        try:
+            await self._conn.close()
+        except Exception:
+            pass
 
 class TursoCursor:
-    """Independent cursor wrapper for thread-safe reads."""
-    def __init__(self, cursor):
-        self._cursor = cursor
+    """Cursor over rows already fetched on the worker thread."""
+    def __init__(self, rows):
+        self._rows = rows
     
     async def fetchone(self):
-        return await asyncio.to_thread(self._cursor.fetchone)
+        return self._rows[0] if self._rows else None
     
     async def fetchall(self):
-        return await asyncio.to_thread(self._cursor.fetchall)
+        return self._rows
+
+# Turso stream/session counters (reported by get_db_stats)
+TURSO_STATS = {"stream_errors": 0, "stream_reconnects": 0, "replayed": 0, "timeouts": 0}
+# Seconds to wait for Turso before giving up on a call (0 = wait forever)
+TURSO_TIMEOUT_SECONDS = float(os.environ.get("TURSO_TIMEOUT_SECONDS", "10"))
+
+
+def _is_stream_error(e: Exception) -> bool:
+    """True for errors caused by the server dropping an idle Hrana stream."""
+    msg = str(e).lower()
+    return ("stream" in msg and ("expired" in msg or "not found" in msg)) or "404" in msg
+
+
+def _is_read(sql: str) -> bool:
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in ("SELECT", "EXPLAIN")
+
+
+_LITERAL_SKIP_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\?\d*", re.DOTALL)
+
+
+def _signed(text: str) -> str:
+    # Bare, "x -?" with -5 would become "x --5" and start a comment
+    return f"({text})" if text.startswith("-") else text
+
+
+def _sql_literal(value) -> str | None:
+    """value as an exact SQLite literal, or None if it has no exact one."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return _signed(str(value)) if -2**63 <= value < 2**63 else None
+    if isinstance(value, float):
+        return _signed(repr(value)) if math.isfinite(value) else None
+    if isinstance(value, str):
+        return None if "\x00" in value else "'" + value.replace("'", "''") + "'"
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+    return None
+
+
+def _inline_params(sql: str, params: tuple) -> str | None:
+    """sql with each ? replaced by its parameter as a literal (None if not possible)."""
+    literals = [_sql_literal(p) for p in params]
+    if None in literals:
+        return None
+    out, pos, used = [], 0, 0
+    for m in _LITERAL_SKIP_RE.finditer(sql):
+        token = m.group(0)
+        if not token.startswith("?"):
+            continue  # string, quoted name or comment
+        if token != "?" or used == len(literals):
+            return None  # numbered placeholder, or too few parameters
+        out.append(sql[pos:m.start()])
+        out.append(literals[used])
+        pos, used = m.end(), used + 1
+    if used != len(literals):
+        return None
+    out.append(sql[pos:])
+    return "".join(out)
+
+
+def _batch_script(groups: list[tuple[str, list[tuple]]]) -> str | None:
+    """A BEGIN ... COMMIT script running every statement, or None if one cannot be inlined."""
+    statements = []
+    for sql, params in groups:
+        for p in params:
+            inlined = _inline_params(sql, p)
+            if inlined is None:
+                return None
+            statements.append(inlined.strip().rstrip(";"))
+    # Separators on their own line so a trailing -- comment cannot swallow one
+    return "BEGIN;\n" + "\n;\n".join(statements) + "\n;\nCOMMIT;"
+
+
+def _turso_connect():
+    return libsql.connect(TURSO_URL, auth_token=TURSO_TOKEN)
+
+
+def _resolve(fut: asyncio.Future, result, error, wait_ms: float):
+    _record_wait("turso_queue", wait_ms)
+    if fut.cancelled():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+class _Job:
+    __slots__ = ("fn", "fut", "loop", "replay", "txn", "queued")
+
+    def __init__(self, fn, fut, loop, replay, txn):
+        self.fn = fn
+        self.fut = fut
+        self.loop = loop
+        self.replay = replay
+        self.txn = txn  # True: opens a transaction, False: ends it, None: neither
+        self.queued = time.perf_counter()
+
 
 class TursoConnection:
-    """Wrapper to make libsql work like aiosqlite"""
-    def __init__(self, conn):
-        self._conn = conn
-        self._lock = asyncio.Lock()  # Serialize writes/access to the shared connection
-    
-    async def execute(self, sql, params=None):
+    """Wrapper to make libsql work like aiosqlite.
+
+    The libsql connection is owned by one worker thread that takes jobs off a
+    queue in order. Each statement is executed and fully fetched in a single
+    job, so a query costs one thread hop instead of one per call, and the
+    bot's default executor is left alone. Callers can queue several jobs
+    before awaiting any of them (see submit) and the worker runs them back
+    to back.
+
+    Connections are long-lived (see ConnectionPool). If the server expired
+    the stream, the connection is reopened and a statement that opened no
+    transaction yet is replayed transparently; mid-transaction the error is
+    re-raised after the reconnect, since the earlier statements were lost.
+    """
+    def __init__(self):
+        self._conn = None
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._in_txn = False  # A write has run since the last commit/rollback (worker thread only)
+        self._abandoned = False  # A call timed out; the worker may be stuck on it
+        self._thread = threading.Thread(target=self._work, name="turso-db", daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            wait_ms = (time.perf_counter() - job.queued) * 1000
+            try:
+                result, error = self._call(job), None
+            except Exception as e:
+                result, error = None, e
+            job.loop.call_soon_threadsafe(_resolve, job.fut, result, error, wait_ms)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+    def _call(self, job: _Job):
+        if self._conn is None:
+            self._conn = _turso_connect()
+        try:
+            result = job.fn(self._conn)
+        except Exception as e:
+            if not _is_stream_error(e):
+                raise
+            TURSO_STATS["stream_errors"] += 1
+            # An expired stream rejects the request, so nothing ran yet
+            can_replay = job.replay and not self._in_txn
+            self._reconnect()
+            if not can_replay:
+                raise
+            TURSO_STATS["replayed"] += 1
+            result = job.fn(self._conn)
+        if job.txn is not None:
+            self._in_txn = job.txn
+        return result
+
+    def _reconnect(self):
+        TURSO_STATS["stream_reconnects"] += 1
+        old, self._conn = self._conn, _turso_connect()
+        self._in_txn = False
+        try:
+            old.close()
+        except Exception:
+            pass
+
+    def _submit(self, fn, replay: bool = True, txn: bool | None = None, timing=None) -> asyncio.Future:
+        if self._abandoned:
+            raise ConnectionError("Turso connection abandoned after a timeout")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if timing is not None:
+            caller, sql, shape = timing
+            start = time.perf_counter()
+            fut.add_done_callback(lambda _: _record_query(caller, sql, shape, start))
+        self._jobs.put(_Job(fn, fut, loop, replay, txn))
+        return fut
+
+    def submit(self, sql, params=None) -> asyncio.Future:
+        """Queue a statement without waiting; the future resolves to its rows."""
         METRICS["queries"] += 1  # Track query count
         # libsql_experimental requires a tuple, not a list
         _params = tuple(params) if params is not None else ()
-        def _exec():
-            return self._conn.execute(sql, _params)
-        async with self._lock:
-            result = await asyncio.to_thread(_exec)
-        return TursoCursor(result)
+        return self._submit(
+            lambda conn: conn.execute(sql, _params).fetchall(),
+            txn=None if _is_read(sql) else True,
+            timing=(_caller(), sql, _param_shape(_params)),
+        )
+
+    async def wait(self, awaitable):
+        """Await a queued call, giving up after TURSO_TIMEOUT_SECONDS.
+
+        On timeout the connection is abandoned (every later call raises), so
+        the pool discards it instead of queueing behind a hung request.
+        """
+        if TURSO_TIMEOUT_SECONDS <= 0:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, TURSO_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            TURSO_STATS["timeouts"] += 1
+            self._abandoned = True
+            raise TimeoutError(f"Turso did not answer within {TURSO_TIMEOUT_SECONDS}s") from None
+
+    async def connect(self):
+        """Open the connection on the worker thread (raises if it cannot)."""
+        await self.wait(self._submit(lambda conn: None))
+        return self
+
+    async def execute(self, sql, params=None):
+        return TursoCursor(await self.wait(self.submit(sql, params)))
     
+    async def executemany(self, sql, seq_of_params):
+        METRICS["queries"] += 1
+        _seq = [tuple(p) for p in seq_of_params]
+        shape = f"{len(_seq)} x {_param_shape(_seq[0] if _seq else ())}"
+        await self.wait(self._submit(
+            lambda conn: conn.executemany(sql, _seq), txn=True, timing=(_caller(), sql, shape)
+        ))
+
+    async def run_groups(self, groups: list[tuple[str, list[tuple]]]):
+        """Run [(sql, [params, ...]), ...] in order as one worker job, one executemany per group."""
+        METRICS["queries"] += len(groups)
+        groups = [(sql, [tuple(p) for p in params]) for sql, params in groups]
+
+        def run(conn):
+            for sql, params in groups:
+                if len(params) == 1:
+                    conn.execute(sql, params[0]).fetchall()
+                else:
+                    conn.executemany(sql, params)
+
+        shape = f"{len(groups)} groups, {sum(len(p) for _, p in groups)} rows"
+        await self.wait(self._submit(
+            run, txn=True, timing=(_caller(), "; ".join(sql for sql, _ in groups), shape)
+        ))
+
+    async def commit_groups(self, groups: list[tuple[str, list[tuple]]]):
+        """Run groups as one transaction and commit it.
+
+        Outside a transaction the statements go out as a single
+        BEGIN ... COMMIT script with the parameters inlined (one request).
+        If this connection already has uncommitted writes, or a value cannot
+        be written as an exact SQL literal, it falls back to one executemany
+        per group plus the commit, still in one worker job.
+        """
+        METRICS["queries"] += len(groups)
+        METRICS["commits"] += 1
+        groups = [(sql, [tuple(p) for p in params]) for sql, params in groups]
+        script = _batch_script(groups)
+
+        def run(conn):
+            if script is not None and not self._in_txn:
+                conn.executescript(script)
+                return
+            for sql, params in groups:
+                if len(params) == 1:
+                    conn.execute(sql, params[0]).fetchall()
+                else:
+                    conn.executemany(sql, params)
+            conn.commit()
+
+        shape = f"{len(groups)} groups, {sum(len(p) for _, p in groups)} rows"
+        await self.wait(self._submit(
+            run, txn=False, timing=(_caller(), "; ".join(sql for sql, _ in groups), shape)
+        ))
+
     async def executescript(self, sql):
         METRICS["scripts"] += 1  # Track script executions
-        async with self._lock:
-            await asyncio.to_thread(self._conn.executescript, sql)
+        await self.wait(self._submit(lambda conn: conn.executescript(sql), timing=(_caller(), sql, "script")))
     
     async def commit(self):
         METRICS["commits"] += 1  # Track commits
-        async with self._lock:
-            await asyncio.to_thread(self._conn.commit)
+        await self.wait(self._submit(
+            lambda conn: conn.commit(), replay=False, txn=False, timing=(_caller(), "COMMIT", "()")
+        ))
+
+    async def rollback(self):
+        await self.wait(self._submit(lambda conn: conn.rollback(), txn=False))
+
+    async def ping(self):
+        await self.wait(self._submit(lambda conn: conn.execute("SELECT 1").fetchall()))
     
     async def close(self):
+        self._jobs.put(None)
+        if not self._abandoned:  # A hung worker exits (daemon) once its call returns
+            await asyncio.to_thread(self._thread.join)
+
+
+async def _open_local():
+    if BACKEND == "memory":
+        return MetricsqliteConnection(await aiosqlite.connect(DB_PATH, uri=True))
+    raw = await aiosqlite.connect(DB_PATH)
+    # Per-connection pragmas (journal_mode=WAL is persisted by init())
+    await raw.execute("PRAGMA synchronous=NORMAL")
+    await raw.execute("PRAGMA busy_timeout=5000")
+    return MetricsqliteConnection(raw)
+
+
+async def _open_turso():
+    conn = TursoConnection()
+    try:
+        return await conn.connect()
+    except BaseException:
+        await conn.close()
+        raise
+
+
+# ==================== CONNECTION POOL ====================
+
+# Warm reader connections kept open (0 = a fresh connection per call)
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+# Seconds a pooled connection may sit idle before it is pinged on checkout
+POOL_HEALTHCHECK_IDLE = 30
+# Turso drops idle streams server-side; idle pooled connections are pinged
+# this often so they stay open
+TURSO_KEEPALIVE_SECONDS = float(os.environ.get("TURSO_KEEPALIVE_SECONDS", "5"))
+
+
+def _is_abandoned(conn) -> bool:
+    """True for a Turso connection given up on after a timeout; it never answers again."""
+    return getattr(conn, "_abandoned", False)
+
+
+class _PooledConnection:
+    """A warm connection wrapper plus when it was last used."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Bounded set of warm connections with one dedicated writer.
+
+    Readers are handed out LIFO so the hottest connection is reused first.
+    All writes go through a single connection guarded by a lock, which keeps
+    SQLite writes serialized instead of fighting over the WAL write lock (and
+    stops concurrent Turso helpers committing each other's statements).
+    """
+    def __init__(self, connect, size: int, keepalive: float | None = None):
+        self._connect = connect
+        self.size = size
+        self.keepalive = keepalive
+        self._idle: list[_PooledConnection] = []
+        self._slots = asyncio.Semaphore(size)
+        self._writer: _PooledConnection | None = None
+        self._writer_lock = asyncio.Lock()
+        self._closed = False
+        self._keepalive_task: asyncio.Task | None = None
+        self.stats = {"opened": 0, "reused": 0, "reconnects": 0, "discarded": 0, "keepalive_pings": 0}
+
+    async def _open(self) -> _PooledConnection:
+        conn = await self._connect()
+        self.stats["opened"] += 1
+        if self.keepalive and self._keepalive_task is None:
+            self._keepalive_task = _spawn(self._keepalive_loop())
+        return _PooledConnection(conn)
+
+    async def _discard(self, pooled: _PooledConnection):
+        self.stats["discarded"] += 1
+        await pooled.conn.close()
+
+    async def _check(self, pooled: _PooledConnection | None) -> _PooledConnection:
+        """Return a healthy connection, reconnecting if the old one went bad."""
+        if pooled is not None and _is_abandoned(pooled.conn):
+            self.stats["reconnects"] += 1
+            await self._discard(pooled)
+            pooled = None
+        if pooled is not None:
+            if time.monotonic() - pooled.last_used < POOL_HEALTHCHECK_IDLE:
+                self.stats["reused"] += 1
+                return pooled
+            try:
+                await pooled.conn.ping()
+                self.stats["reused"] += 1
+                return pooled
+            except Exception as e:
+                print(f"[DB] Pooled connection failed health check, reconnecting: {e}")
+                self.stats["reconnects"] += 1
+                await self._discard(pooled)
+        return await self._open()
+
+    async def _release(self, pooled: _PooledConnection, failed: bool) -> bool:
+        """Roll back after a failed block; returns False if the connection is unusable."""
+        pooled.last_used = time.monotonic()
+        if _is_abandoned(pooled.conn):
+            # A call timed out (the block may have carried on in the journal)
+            await self._discard(pooled)
+            return False
+        if not failed:
+            return True
         try:
-            await asyncio.to_thread(self._conn.close)
+            await pooled.conn.rollback()
+            return True
         except Exception:
+            await self._discard(pooled)
+            return False
+
+    async def _keepalive_loop(self):
+        """Ping connections that have sat idle for a full keep-alive interval."""
+        while not self._closed:
+            await asyncio.sleep(self.keepalive)
+            cutoff = time.monotonic() - self.keepalive
+            for pooled in list(self._idle):
+                if pooled.last_used <= cutoff and pooled in self._idle:
+                    await self._ping_idle(pooled)
+            writer = self._writer
+            if writer is not None and writer.last_used <= cutoff and not self._writer_lock.locked():
+                async with self._writer_lock:
+                    if self._writer is writer:
+                        await self._ping_idle(writer)
+
+    async def _ping_idle(self, pooled: _PooledConnection):
+        try:
+            await pooled.conn.ping()
+            self.stats["keepalive_pings"] += 1
+        except Exception as e:
+            # Leave it for the checkout health check to replace
+            print(f"[DB] Keep-alive ping failed: {e}")
+            return
+        pooled.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def reader(self):
+        queued = time.perf_counter()
+        async with self._slots:
+            _record_wait("pool_reader", (time.perf_counter() - queued) * 1000)
+            pooled = await self._check(self._idle.pop() if self._idle else None)
+            failed = False
+            try:
+                yield pooled.conn
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                if await self._release(pooled, failed):
+                    if self._closed:
+                        await pooled.conn.close()
+                    else:
+                        self._idle.append(pooled)
+
+    @asynccontextmanager
+    async def writer(self):
+        held = _writer_conn.get()
+        if held is not None:
+            # Nested helper call inside a write block: reuse the same connection
+            yield held
+            return
+        queued = time.perf_counter()
+        async with self._writer_lock:
+            _record_wait("pool_writer", (time.perf_counter() - queued) * 1000)
+            self._writer = await self._check(self._writer)
+            pooled = self._writer
+            token = _writer_conn.set(pooled.conn)
+            failed = False
+            try:
+                yield pooled.conn
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                _writer_conn.reset(token)
+                if not await self._release(pooled, failed):
+                    self._writer = None
+
+    async def close(self):
+        self._closed = True
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+        async with self._writer_lock:
+            conns = self._idle + ([self._writer] if self._writer else [])
+            self._idle, self._writer = [], None
+        for pooled in conns:
+            await pooled.conn.close()
+
+
+# Writer connection held by the current task (lets nested write helpers share it)
+_writer_conn: contextvars.ContextVar = contextvars.ContextVar("_writer_conn", default=None)
+_pool: ConnectionPool | None = None
+
+
+def _spawn(coro) -> asyncio.Task:
+    """Start a background task in a fresh context.
+
+    A task copies the context it was created in, so one started inside a
+    write block would inherit _writer_conn and keep reusing that connection
+    (without the writer lock) long after the block released it.
+    """
+    return contextvars.Context().run(asyncio.get_running_loop().create_task, coro)
+
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        if USE_TURSO:
+            _pool = ConnectionPool(_open_turso, POOL_SIZE, keepalive=TURSO_KEEPALIVE_SECONDS)
+        else:
+            _pool = ConnectionPool(_open_local, POOL_SIZE)
+    return _pool
+
+
+@asynccontextmanager
+async def get_connection(write: bool = False):
+    """Get a database connection - works with both Turso and local SQLite.
+
+    Pass write=True for anything that modifies data so writes are routed
+    through the pool's single writer connection. While Turso is unreachable
+    this hands out journal/replica connections instead (see WRITE JOURNAL).
+    """
+    if BACKEND is None:
+        raise RuntimeError("db.configure() must be called before using the database")
+    try:
+        async with AsyncExitStack() as stack:
+            if _degraded:
+                conn = await stack.enter_async_context(_degraded_connection(write))
+            else:
+                try:
+                    conn = await stack.enter_async_context(_primary_connection(write))
+                    if JOURNAL_PATH is not None:
+                        conn = FailoverConnection(conn)
+                except Exception as e:
+                    # Nothing ran yet, so this call can already go to the fallback
+                    if not _degrade_on(e):
+                        raise
+                    conn = await stack.enter_async_context(_degraded_connection(write))
+            try:
+                yield conn
+            except Exception as e:
+                _degrade_on(e)
+                raise
+    finally:
+        if write:
+            _note_write()
+
+
+@asynccontextmanager
+async def _primary_connection(write: bool = False):
+    if BACKEND == "memory":
+        # Shared-cache tables use table locks (SQLITE_LOCKED, which busy_timeout
+        # does not retry), so every call shares the one writer connection
+        async with _get_pool().writer() as conn:
+            yield conn
+    elif POOL_SIZE <= 0:
+        conn = await (_open_turso() if USE_TURSO else _open_local())
+        try:
+            yield conn
+        finally:
+            await conn.close()
+    else:
+        pool = _get_pool()
+        async with (pool.writer() if write else pool.reader()) as conn:
+            yield conn
+
+
+async def close():
+    """Flush buffered writes and close pooled connections (call on shutdown)."""
+    global _pool, _counter_task, _counter_flush_lock, _counter_wake
+    global _ledger_task, _compactor_task, _ledger_lock, _ledger_wake
+    try:
+        await flush_counters()
+    except Exception as e:
+        print(f"[DB] Final counter flush failed: {e}")
+    try:
+        await compact_ledger()
+    except Exception as e:
+        print(f"[DB] Final ledger flush failed: {e}")
+    try:
+        await flush_directory()
+    except Exception as e:
+        print(f"[DB] Final directory flush failed: {e}")
+    # The next database may not have these names
+    _directory.clear()
+    _directory_dirty.clear()
+    for task in (_counter_task, _ledger_task, _compactor_task):
+        if task is not None:
+            task.cancel()
+    _counter_task = _ledger_task = _compactor_task = None
+    # Fresh primitives so a later event loop (tests, benchmarks) can reuse the module
+    _counter_flush_lock = asyncio.Lock()
+    _counter_wake = asyncio.Event()
+    _ledger_lock = asyncio.Lock()
+    _ledger_wake = asyncio.Event()
+    await _stop_journal()
+    await _stop_replica()
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+# ==================== READ REPLICA ====================
+
+# Optional local SQLite copy of the primary (configure(replica=...)). Read-mostly
+# helpers read it through replica_connection(); every write still goes to the
+# primary. The sync hook refreshes it every REPLICA_SYNC_SECONDS and shortly
+# after writes, at most once per REPLICA_SYNC_MIN_GAP.
+REPLICA_PATH: str | None = None
+REPLICA_SYNC_SECONDS = float(os.environ.get("DB_REPLICA_SYNC_SECONDS", "30"))
+REPLICA_SYNC_MIN_GAP = float(os.environ.get("DB_REPLICA_SYNC_MIN_GAP", "1"))
+
+REPLICA_STATS = {"syncs": 0, "sync_failures": 0, "last_sync_ms": 0.0, "replica_reads": 0, "primary_reads": 0}
+
+# Bumped when a write connection is released. A sync that starts at generation
+# N carries every write released before it.
+_write_gen = 0
+_synced_gen = -1
+# guild_id (None = guild-less data) -> generation the replica must reach before
+# it serves that guild again, see read_your_writes()
+_pinned: dict[str | None, int] = {}
+_replica_pool: ConnectionPool | None = None
+_replica_sync_hook = None
+_replica_executor: ThreadPoolExecutor | None = None
+_replica_task: asyncio.Task | None = None
+_replica_wake = asyncio.Event()
+_replica_lock = asyncio.Lock()
+# libsql embedded replica connection, owned by the sync thread
+_libsql_replica = None
+
+
+def _note_write():
+    global _write_gen
+    _write_gen += 1
+    if _replica_task is not None:
+        _replica_wake.set()
+
+
+def _sync_from_local():
+    """Copy the local primary into the replica file in one step (offline stand-in for a Turso sync)."""
+    src = sqlite3.connect(DB_PATH, uri=BACKEND == "memory")
+    dst = sqlite3.connect(REPLICA_PATH, timeout=5)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _sync_from_turso():
+    """Pull new frames from Turso into a libsql embedded replica."""
+    global _libsql_replica
+    if _libsql_replica is None:
+        _libsql_replica = libsql.connect(REPLICA_PATH, sync_url=TURSO_URL, auth_token=TURSO_TOKEN)
+    _libsql_replica.sync()
+
+
+def set_replica_sync(hook=None):
+    """Replace the replica sync hook (a blocking callable run on the sync thread).
+
+    None restores the default: a libsql sync for Turso, a file copy of the
+    primary otherwise.
+    """
+    global _replica_sync_hook
+    _replica_sync_hook = hook
+
+
+async def _open_replica():
+    raw = await aiosqlite.connect(REPLICA_PATH)
+    await raw.execute("PRAGMA busy_timeout=5000")
+    await raw.execute("PRAGMA query_only=1")
+    return MetricsqliteConnection(raw)
+
+
+async def sync_replica() -> bool:
+    """Bring the replica up to date now. Returns False if the sync hook failed."""
+    global _synced_gen, _replica_pool, _replica_executor
+    if REPLICA_PATH is None or _degraded:
+        return False
+    async with _replica_lock:
+        if _replica_executor is None:
+            _replica_executor = ThreadPoolExecutor(1, thread_name_prefix="db-replica")
+        hook = _replica_sync_hook or (_sync_from_turso if USE_TURSO else _sync_from_local)
+        target = _write_gen
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(_replica_executor, hook)
+        except Exception as e:
+            REPLICA_STATS["sync_failures"] += 1
+            print(f"[DB] Replica sync failed: {e}")
+            return False
+        _synced_gen = max(_synced_gen, target)
+        REPLICA_STATS["syncs"] += 1
+        REPLICA_STATS["last_sync_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if _replica_pool is None:
+            _replica_pool = ConnectionPool(_open_replica, max(POOL_SIZE, 1))
+    return True
+
+
+async def _replica_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_replica_wake.wait(), REPLICA_SYNC_SECONDS)
+        except asyncio.TimeoutError:
             pass
+        _replica_wake.clear()
+        await sync_replica()
+        await asyncio.sleep(REPLICA_SYNC_MIN_GAP)
+
+
+async def _start_replica():
+    global _replica_task
+    if REPLICA_PATH is None:
+        return
+    if not await sync_replica():
+        print("[DB] Replica not ready yet, reads stay on the primary")
+    if _replica_task is None or _replica_task.done():
+        _replica_task = _spawn(_replica_loop())
+
+
+def _close_libsql_replica():
+    global _libsql_replica
+    if _libsql_replica is not None:
+        conn, _libsql_replica = _libsql_replica, None
+        conn.close()
+
+
+async def _stop_replica():
+    global _replica_task, _replica_pool, _replica_executor, _synced_gen, _replica_wake, _replica_lock
+    if _replica_task is not None:
+        _replica_task.cancel()
+        _replica_task = None
+    async with _replica_lock:
+        if _replica_pool is not None:
+            pool, _replica_pool = _replica_pool, None
+            await pool.close()
+        if _replica_executor is not None:
+            executor, _replica_executor = _replica_executor, None
+            await asyncio.get_running_loop().run_in_executor(executor, _close_libsql_replica)
+            executor.shutdown()
+    _synced_gen = -1
+    _pinned.clear()
+    _replica_wake = asyncio.Event()
+    _replica_lock = asyncio.Lock()
+
+
+def read_your_writes(guild_id: str | None = None):
+    """Serve guild_id's replica reads from the primary until the replica has
+    synced past every write made so far. None pins guild-less data (D&D).
+    """
+    if _replica_pool is not None:
+        _pinned[guild_id] = _write_gen
+        _replica_wake.set()
+
+
+def _replica_behind(guild_id: str | None) -> bool:
+    pinned = _pinned.get(guild_id)
+    if pinned is None:
+        return False
+    if pinned <= _synced_gen:
+        del _pinned[guild_id]
+        return False
+    return True
+
 
+@asynccontextmanager
+async def replica_connection(guild_id: str | None = None):
+    """Reader for read-mostly helpers: the replica when it is synced and not
+    pinned for guild_id, otherwise a primary reader. Inside a write block the
+    primary is used so the caller sees its own uncommitted changes.
+    """
+    if _replica_pool is None or _writer_conn.get() is not None or _replica_behind(guild_id):
+        REPLICA_STATS["primary_reads"] += 1
+        async with get_connection() as conn:
+            yield conn
+        return
+    REPLICA_STATS["replica_reads"] += 1
+    async with _replica_pool.reader() as conn:
+        yield conn
+
+
+# ==================== WRITE JOURNAL ====================
+
+# When Turso stops answering, writes are appended to a local journal instead
+# of failing: each commit becomes one JSON line with an idempotency key, made
+# durable by a single fsync. Reads fall back to the in-memory caches and the
+# read replica. A probe replays the journal in order once the primary answers
+# again; keys already in journal_applied are skipped, so a replay cut short by
+# a crash can simply run again on the next start. Transactions sent to the
+# primary also record their key before committing, so a commit that timed out
+# but landed is journaled and then skipped on replay instead of applied twice.
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_data.journal")
+JOURNAL_PATH: str | None = None  # set by configure() for Turso
+# Seconds between reconnect attempts while degraded
+JOURNAL_PROBE_SECONDS = float(os.environ.get("DB_JOURNAL_PROBE_SECONDS", "5"))
+
+JOURNAL_STATS = {"outages": 0, "records": 0, "statements": 0, "fsyncs": 0,
+                 "replayed": 0, "duplicates": 0, "rejected": 0}
+
+_degraded = False
+_journal_file = None
+_journal_session = f"{os.getpid()}-{time.time_ns()}"
+_journal_seq = 0
+# Bytes of the journal already applied by the current replay
+_replay_offset = 0
+_journal_lock = asyncio.Lock()
+_replay_lock = asyncio.Lock()
+_probe_task: asyncio.Task | None = None
+
+
+class DatabaseUnavailable(RuntimeError):
+    """The primary is unreachable and the fallback cannot answer this call."""
+
+
+def _is_unreachable(e: BaseException) -> bool:
+    """True for errors meaning the server could not be reached (not bad SQL)."""
+    if isinstance(e, DatabaseUnavailable):
+        return False
+    if isinstance(e, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    msg = str(e).lower()
+    return any(s in msg for s in ("timed out", "connection", "error sending request", "dns", "unreachable"))
+
+
+def _degrade_on(e: BaseException) -> bool:
+    """Switch to the journal if e means Turso is unreachable. Returns True if degraded."""
+    global _degraded, _probe_task
+    if _degraded:
+        return True
+    if JOURNAL_PATH is None or not _is_unreachable(e):
+        return False
+    _degraded = True
+    JOURNAL_STATS["outages"] += 1
+    print(f"[DB] Primary unreachable ({e}); journaling writes to {JOURNAL_PATH}")
+    if _probe_task is None or _probe_task.done():
+        _probe_task = _spawn(_probe_loop())
+    return True
 
-async def _get_turso_connection():
-    """Create a fresh Turso connection each time (streams expire, caching causes 404s)."""
-    def _connect():
-        return libsql.connect(TURSO_URL, auth_token=TURSO_TOKEN)
-    raw_conn = await asyncio.to_thread(_connect)
-    return TursoConnection(raw_conn), raw_conn
+
+def _journal_size() -> int:
+    try:
+        return os.path.getsize(JOURNAL_PATH)
+    except (OSError, TypeError):
+        return 0
+
+
+def _open_journal():
+    """Open the journal for appending, dropping a torn last line from a crash."""
+    global _journal_file
+    if _journal_file is not None:
+        return
+    f = open(JOURNAL_PATH, "a+b")
+    size = f.seek(0, os.SEEK_END)
+    if size:
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+        keep = size - len(tail) + tail.rfind(b"\n") + 1 if b"\n" in tail else 0
+        if keep != size:
+            f.truncate(keep)
+    _journal_file = f
+
+
+def _write_journal(line: bytes):
+    _open_journal()
+    _journal_file.write(line)
+    _journal_file.flush()
+    os.fsync(_journal_file.fileno())
+
+
+def _close_journal():
+    global _journal_file
+    if _journal_file is not None:
+        f, _journal_file = _journal_file, None
+        f.close()
+
+
+_APPLIED_INSERT = "INSERT INTO journal_applied (key, applied_at) VALUES (?, ?)"
+
+
+def _new_txn_key() -> str:
+    global _journal_seq
+    _journal_seq += 1
+    return f"{_journal_session}-{_journal_seq}"
+
+
+async def _append_journal(statements: list[tuple[str, list]], key: str | None = None) -> bool:
+    """Durably append one transaction. Returns False if the primary is back (write it there).
+
+    key is the idempotency key the primary may already have committed under.
+    """
+    async with _journal_lock:
+        if not _degraded:
+            return False
+        record = {"key": key or _new_txn_key(), "ts": _now_ms(), "statements": statements}
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        await asyncio.to_thread(_write_journal, line)
+        JOURNAL_STATS["records"] += 1
+        JOURNAL_STATS["statements"] += len(statements)
+        JOURNAL_STATS["fsyncs"] += 1
+    return True
+
+
+class JournalConnection:
+    """Stand-in write connection while the primary is unreachable.
+
+    Writes are collected until commit(), which journals them as one record.
+    Reads are answered by the replica (without this block's own writes).
+    Statements that need the server's answer (RETURNING, scripts) raise
+    DatabaseUnavailable.
+    """
+    def __init__(self):
+        self._pending: list[tuple[str, list]] = []
+        self._key: str | None = None
+
+    async def execute(self, sql, params=None):
+        if _is_read(sql):
+            async with _degraded_connection() as reader:
+                return TursoCursor(await (await reader.execute(sql, params or ())).fetchall())
+        if "RETURNING" in sql.upper():
+            raise DatabaseUnavailable("Primary database unreachable; cannot run a RETURNING statement")
+        self._pending.append((sql, list(params or ())))
+        return TursoCursor([])
+
+    async def executemany(self, sql, seq_of_params):
+        self._pending.extend((sql, list(p)) for p in seq_of_params)
+
+    async def executescript(self, sql):
+        raise DatabaseUnavailable("Primary database unreachable; scripts cannot be journaled")
+
+    async def commit(self):
+        pending, self._pending = self._pending, []
+        key, self._key = self._key, None
+        if not pending or await _append_journal(pending, key):
+            return
+        # Recovered while this block was running: the journal is drained, so write
+        # directly (skipping it if the timed-out commit did land after all)
+        record = {"key": key or _new_txn_key(), "statements": pending}
+        if _writer_conn.get() is None:
+            await _apply_record(record)
+            return
+        # This block holds the writer lock but its connection failed; use a fresh one
+        conn = await (_open_turso() if USE_TURSO else _open_local())
+        try:
+            await _apply_record(record, conn)
+        finally:
+            await conn.close()
+
+    async def rollback(self):
+        self._pending = []
+        self._key = None
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        self._pending = []
+
+
+class FailoverConnection:
+    """Primary connection that moves to the journal mid-block if Turso stops answering.
+
+    Writes are remembered until commit. The server-side transaction dies
+    with the connection, so on failover the whole uncommitted transaction is
+    handed to a JournalConnection and the caller's block carries on there.
+    Each write transaction inserts its idempotency key into journal_applied
+    just before committing, so a commit that times out (it may have landed)
+    is journaled under that key and skipped on replay if it did.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self._txn: list[tuple[str, list]] = []
+        self._fallback: JournalConnection | None = None
+
+    def _switch(self, e: Exception, key: str | None = None):
+        if not _degrade_on(e):
+            raise e
+        self._fallback = JournalConnection()
+        self._fallback._pending = self._txn
+        self._fallback._key = key
+        self._txn = []
+
+    async def execute(self, sql, params=None):
+        if self._fallback is None:
+            try:
+                cursor = await self._conn.execute(sql, params or ())
+            except Exception as e:
+                self._switch(e)
+            else:
+                if not _is_read(sql):
+                    self._txn.append((sql, list(params or ())))
+                return cursor
+        return await self._fallback.execute(sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        seq = [list(p) for p in seq_of_params]
+        if self._fallback is None:
+            try:
+                await self._conn.executemany(sql, seq)
+            except Exception as e:
+                self._switch(e)
+            else:
+                self._txn.extend((sql, p) for p in seq)
+                return
+        await self._fallback.executemany(sql, seq)
+
+    async def run_batch(self, b: "Batch"):
+        if self._fallback is None:
+            try:
+                await b.run(self._conn)
+            except Exception as e:
+                self._switch(e)
+            else:
+                self._txn.extend((sql, list(p)) for sql, params in b._groups for p in params)
+                return
+        await b.run(self._fallback)
+
+    async def commit_batch(self, b: "Batch"):
+        """Run b and commit, together with this block's earlier writes and its key."""
+        if self._fallback is None:
+            key = _new_txn_key()
+            keyed = Batch()
+            keyed._groups = [*b._groups, (_APPLIED_INSERT, [(key, _now_ms())])]
+            try:
+                await keyed.commit(self._conn)
+            except Exception as e:
+                self._txn.extend((sql, list(p)) for sql, params in b._groups for p in params)
+                self._switch(e, key)
+            else:
+                self._txn = []
+                return
+            return await self.commit()
+        await b.run(self._fallback)
+        await self.commit()
+
+    async def executescript(self, sql):
+        await self._conn.executescript(sql)
+
+    async def commit(self):
+        if self._fallback is None:
+            key = None
+            try:
+                if self._txn:
+                    key = _new_txn_key()
+                    await self._conn.execute(_APPLIED_INSERT, (key, _now_ms()))
+                await self._conn.commit()
+            except Exception as e:
+                self._switch(e, key)
+            else:
+                self._txn = []
+                return
+        try:
+            await self._conn.rollback()  # Release whatever the server still holds
+        except Exception:
+            pass
+        await self._fallback.commit()
+
+    async def rollback(self):
+        self._txn = []
+        if self._fallback is not None:
+            await self._fallback.rollback()
+        else:
+            await self._conn.rollback()
+
+    async def ping(self):
+        await self._conn.ping()
+
+    async def close(self):
+        await self._conn.close()
 
 
 @asynccontextmanager
-async def get_connection():
-    """Get a database connection - works with both Turso and local SQLite"""
-    if USE_TURSO:
-        wrapper, raw_conn = await _get_turso_connection()
+async def _degraded_connection(write: bool = False):
+    if write:
+        conn = JournalConnection()
         try:
-            yield wrapper
+            yield conn
         finally:
-            await wrapper.close()
+            await conn.rollback()  # Uncommitted statements are dropped, like a rollback
+    elif _replica_pool is not None:
+        async with _replica_pool.reader() as conn:
+            yield conn
     else:
-        async with aiosqlite.connect(DB_PATH) as conn:
-            # Wrap the local connection to track metrics
-            yield MetricsqliteConnection(conn)
+        raise DatabaseUnavailable("Primary database unreachable and no read replica is configured")
+
+
+def _read_journal(offset: int) -> list[tuple[int, dict]]:
+    """Complete records after offset, each with the offset just past it."""
+    records = []
+    with open(JOURNAL_PATH, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Being written, or torn by a crash
+            offset += len(line)
+            records.append((offset, json.loads(line)))
+    return records
+
+
+def _reject_record(record: dict, error: Exception):
+    with open(JOURNAL_PATH + ".rejected", "a", encoding="utf-8") as f:
+        f.write(json.dumps({**record, "error": str(error)}) + "\n")
+
+
+async def _apply_record(record: dict, conn=None) -> bool:
+    """Run one journaled transaction on the primary. Returns False if it was already applied."""
+    async with AsyncExitStack() as stack:
+        if conn is None:
+            conn = await stack.enter_async_context(_primary_connection(write=True))
+        cursor = await conn.execute("SELECT 1 FROM journal_applied WHERE key = ?", (record["key"],))
+        if await cursor.fetchone():
+            return False
+        b = Batch()
+        for sql, params in record["statements"]:
+            b.add(sql, params)
+        b.add(_APPLIED_INSERT, (record["key"], _now_ms()))
+        await b.commit(conn)
+    return True
+
+
+async def replay_journal() -> int:
+    """Apply journaled writes to the primary in order. Returns records applied.
+
+    Leaves degraded mode once the journal is drained; raises if the primary is
+    still unreachable. A record the primary rejects (bad SQL, constraint) is
+    moved to <journal>.rejected so it cannot block the rest.
+    """
+    global _degraded, _replay_offset
+    if JOURNAL_PATH is None:
+        return 0
+    applied = 0
+    async with _replay_lock:
+        while True:
+            records = await asyncio.to_thread(_read_journal, _replay_offset) if os.path.exists(JOURNAL_PATH) else []
+            if not records:
+                async with _journal_lock:
+                    # Nothing can be appended while we hold the lock, so this switch is exact
+                    if _replay_offset < _journal_size():
+                        continue
+                    _close_journal()
+                    if os.path.exists(JOURNAL_PATH):
+                        os.truncate(JOURNAL_PATH, 0)
+                    _replay_offset = 0
+                    if _degraded:
+                        _degraded = False
+                        print(f"[DB] Primary reachable again; replayed {applied} journaled writes")
+                if applied:
+                    # Caches built from the replica during the outage missed journaled chips
+                    invalidate_rank_cache()
+                return applied
+            for end, record in records:
+                try:
+                    if await _apply_record(record):
+                        JOURNAL_STATS["replayed"] += 1
+                        applied += 1
+                    else:
+                        JOURNAL_STATS["duplicates"] += 1
+                except Exception as e:
+                    if _is_unreachable(e):
+                        raise
+                    JOURNAL_STATS["rejected"] += 1
+                    print(f"[DB] Journal record {record['key']} rejected: {e}")
+                    await asyncio.to_thread(_reject_record, record, e)
+                _replay_offset = end
+
+
+async def _probe_loop():
+    while _degraded:
+        await asyncio.sleep(JOURNAL_PROBE_SECONDS)
+        try:
+            await replay_journal()
+        except Exception as e:
+            if not _is_unreachable(e):
+                print(f"[DB] Journal replay failed: {e}")
+
+
+async def _stop_journal():
+    global _probe_task, _degraded, _replay_offset, _journal_lock, _replay_lock
+    if _probe_task is not None:
+        _probe_task.cancel()
+        _probe_task = None
+    _close_journal()
+    # Anything still journaled is replayed by the next init()
+    _degraded = False
+    _replay_offset = 0
+    _journal_lock = asyncio.Lock()
+    _replay_lock = asyncio.Lock()
+
+
+# ==================== BATCHING ====================
+
+class Batch:
+    """Parameterized statements collected by db.batch().
+
+    Consecutive adds of the same SQL are grouped so they can be sent with a
+    single executemany call.
+    """
+    def __init__(self):
+        self._groups: list[tuple[str, list[tuple]]] = []
+
+    def add(self, sql: str, params=()):
+        if self._groups and self._groups[-1][0] == sql:
+            self._groups[-1][1].append(tuple(params))
+        else:
+            self._groups.append((sql, [tuple(params)]))
+
+    def __len__(self):
+        return sum(len(params) for _, params in self._groups)
+
+    async def commit(self, conn):
+        """Run the batch and commit; on Turso the transaction is a single request."""
+        if isinstance(conn, FailoverConnection):
+            return await conn.commit_batch(self)
+        if isinstance(conn, TursoConnection):
+            return await conn.commit_groups(self._groups)
+        await self.run(conn)
+        await conn.commit()
+
+    async def run(self, conn):
+        if isinstance(conn, FailoverConnection):
+            return await conn.run_batch(self)
+        if isinstance(conn, TursoConnection):
+            # One worker job for the whole batch: one request per group, one thread hop
+            return await conn.run_groups(self._groups)
+        for sql, params in self._groups:
+            if len(params) == 1:
+                await conn.execute(sql, params[0])
+            else:
+                await conn.executemany(sql, params)
+
+
+@asynccontextmanager
+async def batch():
+    """Collect statements and run them in one transaction when the block exits.
+
+        async with db.batch() as b:
+            b.add("UPDATE ...", (a, b))
+
+    Nothing is sent if the block raises. Same code path for aiosqlite and
+    libsql; on Turso the whole transaction goes out as one request.
+    """
+    b = Batch()
+    yield b
+    if not b:
+        return
+    async with get_connection(write=True) as conn:
+        await b.commit(conn)
 
 
 # ==================== INIT ====================
 
-async def init():
-    """Create all tables if they don't exist"""
-    async with get_connection() as conn:
-        # For local development
-        if not USE_TURSO:
-            await conn.execute("PRAGMA journal_mode=WAL")
-            await conn.execute("PRAGMA synchronous=NORMAL")
+# Schema v2 stores Discord snowflakes as INTEGER (0 = none / global) and
+# timestamps as INTEGER epoch milliseconds. Helpers keep taking and returning
+# string IDs and ISO timestamps; these convert at the SQL boundary.
+
+def _id(value) -> int:
+    return int(value) if value else 0
+
 
-        await conn.executescript("""
+def _sid(value) -> str:
+    return str(value) if value else ""
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def _ms_to_iso(ms: int | None) -> str:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat() if ms else ""
+
+
+def _iso_to_ms(column: str) -> str:
+    """SQL expression converting an ISO-8601 TEXT column to epoch ms (0 if empty)."""
+    return f"COALESCE(CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER), 0)"
+
+
+def _rebuild_table(name: str, create: str, select: str) -> list[str]:
+    """Statements that recreate a table with a new definition, copying its rows."""
+    return [
+        create.replace(f"TABLE {name} ", f"TABLE {name}_v2 ", 1),
+        f"INSERT INTO {name}_v2 SELECT {select} FROM {name}",
+        f"DROP TABLE {name}",
+        f"ALTER TABLE {name}_v2 RENAME TO {name}",
+    ]
+
+
+# Ordered schema migrations. Version N is applied by the Nth entry; each entry
+# is (description, statements) and runs in the same transaction that bumps
+# schema_version. Only append - never edit or reorder a released step.
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    ("base tables", [
+        """
             CREATE TABLE IF NOT EXISTS users (
                 guild_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
@@ -143,8 +1616,9 @@ async def init():
                 chips INTEGER DEFAULT 0,
                 created_at TEXT DEFAULT '',
                 PRIMARY KEY (guild_id, user_id)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS daily_chatter (
                 guild_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
@@ -152,8 +1626,9 @@ async def init():
                 message_count INTEGER DEFAULT 0,
                 date TEXT NOT NULL,
                 PRIMARY KEY (guild_id, user_id, date)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS daily_activity (
                 guild_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
@@ -162,16 +1637,18 @@ async def init():
                 vc_minutes INTEGER DEFAULT 0,
                 date TEXT NOT NULL,
                 PRIMARY KEY (guild_id, user_id, date)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS vc_sessions (
                 guild_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
                 username TEXT DEFAULT '',
                 join_time TEXT NOT NULL,
                 PRIMARY KEY (guild_id, user_id)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS active_chip_drop (
                 guild_id TEXT PRIMARY KEY,
                 channel_id TEXT NOT NULL,
@@ -180,23 +1657,26 @@ async def init():
                 drop_type TEXT NOT NULL,
                 answer TEXT DEFAULT '',
                 created_at TEXT NOT NULL
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS question_usage (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 guild_id TEXT NOT NULL,
                 question_type TEXT NOT NULL,
                 question_index TEXT NOT NULL,
                 used_at TEXT DEFAULT ''
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS bot_state (
                 guild_id TEXT NOT NULL,
                 key TEXT NOT NULL,
                 value TEXT DEFAULT '',
                 PRIMARY KEY (guild_id, key)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS word_games (
                 guild_id TEXT PRIMARY KEY,
                 channel_id TEXT DEFAULT '',
@@ -205,8 +1685,9 @@ async def init():
                 last_contributor_id TEXT DEFAULT '',
                 word_count INTEGER DEFAULT 0,
                 active INTEGER DEFAULT 0
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS typology_profiles (
                 guild_id TEXT NOT NULL,
                 user_id TEXT NOT NULL,
@@ -217,146 +1698,959 @@ async def init():
                 ap TEXT DEFAULT '',
                 updated_at TEXT DEFAULT '',
                 PRIMARY KEY (guild_id, user_id)
-            );
-
+            )
+        """,
+        """
             CREATE TABLE IF NOT EXISTS dnd_inventory (
                 char_key TEXT NOT NULL,
                 item_name TEXT NOT NULL,
                 amount INTEGER DEFAULT 0,
                 PRIMARY KEY (char_key, item_name)
-            );
+            )
+        """,
+    ]),
+    ("leaderboard and reward indexes", [
+        # Leaderboard page and rank counting
+        """
+            CREATE INDEX IF NOT EXISTS idx_users_guild_chips
+                ON users (guild_id, chips DESC)
+        """,
+        # Top-3 reward queries and the per-day clears
+        """
+            CREATE INDEX IF NOT EXISTS idx_daily_chatter_guild_date_count
+                ON daily_chatter (guild_id, date, message_count DESC)
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_daily_activity_guild_date_total
+                ON daily_activity (guild_id, date, (message_points + vc_minutes) DESC)
+        """,
+        # Covers get_used_questions without touching the table
+        """
+            CREATE INDEX IF NOT EXISTS idx_question_usage_guild_type
+                ON question_usage (guild_id, question_type, question_index)
+        """,
+    ]),
+    ("chip ledger", [
+        # AUTOINCREMENT: ids are never reused after deletes, which the compaction
+        # watermark (LEDGER_WATERMARK_KEY) relies on
+        """
+            CREATE TABLE IF NOT EXISTS chip_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                delta INTEGER NOT NULL,
+                source TEXT DEFAULT '',
+                ts TEXT NOT NULL
+            )
+        """,
+        # Uncompacted deltas for one guild (rank cache build)
+        """
+            CREATE INDEX IF NOT EXISTS idx_chip_ledger_guild_id
+                ON chip_ledger (guild_id, id)
+        """,
+    ]),
+    ("spark/casual/personality channel renames", [
+        "UPDATE bot_state SET key = 'channel_casual' WHERE key = 'channel_spark'",
+        "UPDATE question_usage SET question_type = 'casual' WHERE question_type = 'spark'",
+        "UPDATE bot_state SET key = 'channel_warm' WHERE key = 'channel_casual'",
+        "UPDATE bot_state SET key = 'ping_role_warm' WHERE key = 'ping_role_casual'",
+        "UPDATE bot_state SET key = 'role_picker_message_warm' WHERE key = 'role_picker_message_casual'",
+        "UPDATE bot_state SET key = 'channel_chill' WHERE key = 'channel_personality'",
+        "UPDATE bot_state SET key = 'ping_role_chill' WHERE key = 'ping_role_personality'",
+        "UPDATE bot_state SET key = 'role_picker_message_chill' WHERE key = 'role_picker_message_personality'",
+    ]),
+    ("drop integer question indexes", [
+        "DELETE FROM question_usage WHERE typeof(question_index) = 'integer'",
+    ]),
+    # Per-user spam timestamps now live in memory (see _check_spam)
+    ("drop stored spam timestamps", [
+        "DELETE FROM bot_state WHERE key LIKE 'user\\_last\\_msg\\_%' ESCAPE '\\'",
+    ]),
+    ("compact schema v2: integer ids, epoch-ms timestamps, WITHOUT ROWID", [
+        *_rebuild_table("users", """
+            CREATE TABLE users (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT DEFAULT '',
+                chips INTEGER DEFAULT 0,
+                created_at INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            ) WITHOUT ROWID
+        """, f"CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), username, chips, {_iso_to_ms('created_at')}"),
+        # Keyed by day first so a day's rows (top 3, clears, retention) are adjacent
+        *_rebuild_table("daily_chatter", """
+            CREATE TABLE daily_chatter (
+                guild_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT DEFAULT '',
+                message_count INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, date, user_id)
+            ) WITHOUT ROWID
+        """, "CAST(guild_id AS INTEGER), date, CAST(user_id AS INTEGER), username, message_count"),
+        *_rebuild_table("daily_activity", """
+            CREATE TABLE daily_activity (
+                guild_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT DEFAULT '',
+                message_points INTEGER DEFAULT 0,
+                vc_minutes INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, date, user_id)
+            ) WITHOUT ROWID
+        """, "CAST(guild_id AS INTEGER), date, CAST(user_id AS INTEGER), username, message_points, vc_minutes"),
+        *_rebuild_table("vc_sessions", """
+            CREATE TABLE vc_sessions (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT DEFAULT '',
+                join_time INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, user_id)
+            ) WITHOUT ROWID
+        """, f"CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), username, {_iso_to_ms('join_time')}"),
+        *_rebuild_table("active_chip_drop", """
+            CREATE TABLE active_chip_drop (
+                guild_id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                drop_type TEXT NOT NULL,
+                answer TEXT DEFAULT '',
+                created_at INTEGER NOT NULL
+            )
+        """, "CAST(guild_id AS INTEGER), CAST(channel_id AS INTEGER), CAST(message_id AS INTEGER), "
+             f"amount, drop_type, answer, {_iso_to_ms('created_at')}"),
+        *_rebuild_table("question_usage", """
+            CREATE TABLE question_usage (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                question_type TEXT NOT NULL,
+                question_index TEXT NOT NULL,
+                used_at INTEGER DEFAULT 0
+            )
+        """, f"id, CAST(guild_id AS INTEGER), question_type, question_index, {_iso_to_ms('used_at')}"),
+        # Values stay TEXT: the table mixes channel ids, counters and timestamps
+        *_rebuild_table("bot_state", """
+            CREATE TABLE bot_state (
+                guild_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT DEFAULT '',
+                PRIMARY KEY (guild_id, key)
+            ) WITHOUT ROWID
+        """, "CAST(guild_id AS INTEGER), key, value"),
+        *_rebuild_table("word_games", """
+            CREATE TABLE word_games (
+                guild_id INTEGER PRIMARY KEY,
+                channel_id INTEGER DEFAULT 0,
+                message_id INTEGER DEFAULT 0,
+                words TEXT DEFAULT '',
+                last_contributor_id INTEGER DEFAULT 0,
+                word_count INTEGER DEFAULT 0,
+                active INTEGER DEFAULT 0
+            )
+        """, "CAST(guild_id AS INTEGER), CAST(channel_id AS INTEGER), CAST(message_id AS INTEGER), "
+             "words, CAST(last_contributor_id AS INTEGER), word_count, active"),
+        *_rebuild_table("typology_profiles", """
+            CREATE TABLE typology_profiles (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                mbti TEXT DEFAULT '',
+                enneagram TEXT DEFAULT '',
+                tritype TEXT DEFAULT '',
+                instinct TEXT DEFAULT '',
+                ap TEXT DEFAULT '',
+                updated_at INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            ) WITHOUT ROWID
+        """, "CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), mbti, enneagram, tritype, instinct, ap, "
+             f"{_iso_to_ms('updated_at')}"),
+        *_rebuild_table("dnd_inventory", """
+            CREATE TABLE dnd_inventory (
+                char_key TEXT NOT NULL,
+                item_name TEXT NOT NULL,
+                amount INTEGER DEFAULT 0,
+                PRIMARY KEY (char_key, item_name)
+            ) WITHOUT ROWID
+        """, "char_key, item_name, amount"),
+        *_rebuild_table("chip_ledger", """
+            CREATE TABLE chip_ledger (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                source TEXT DEFAULT '',
+                ts INTEGER NOT NULL
+            )
+        """, f"id, CAST(guild_id AS INTEGER), CAST(user_id AS INTEGER), delta, source, {_iso_to_ms('ts')}"),
+        # DROP TABLE took the old indexes with it
+        "CREATE INDEX idx_users_guild_chips ON users (guild_id, chips DESC)",
+        "CREATE INDEX idx_daily_chatter_guild_date_count ON daily_chatter (guild_id, date, message_count DESC)",
+        "CREATE INDEX idx_daily_activity_guild_date_total "
+        "ON daily_activity (guild_id, date, (message_points + vc_minutes) DESC)",
+        "CREATE INDEX idx_question_usage_guild_type ON question_usage (guild_id, question_type, question_index)",
+        "CREATE INDEX idx_chip_ledger_guild_id ON chip_ledger (guild_id, id)",
+    ]),
+    ("user directory", [
+        """
+            CREATE TABLE user_directory (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT NOT NULL DEFAULT '',
+                updated_at INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            ) WITHOUT ROWID
+        """,
+        # Seed from every table that carried a name; later statements (newer data) win
+        *(
+            f"""INSERT INTO user_directory (guild_id, user_id, username)
+                SELECT guild_id, user_id, username FROM {source} WHERE username != ''{order}
+                ON CONFLICT(guild_id, user_id) DO UPDATE SET username = excluded.username"""
+            for source, order in (
+                ("users", ""),
+                ("daily_chatter", " ORDER BY date"),
+                ("daily_activity", " ORDER BY date"),
+                ("vc_sessions", ""),
+            )
+        ),
+        "ALTER TABLE users DROP COLUMN username",
+        "ALTER TABLE daily_chatter DROP COLUMN username",
+        "ALTER TABLE daily_activity DROP COLUMN username",
+        "ALTER TABLE vc_sessions DROP COLUMN username",
+    ]),
+    ("write journal idempotency keys", [
+        """
+            CREATE TABLE journal_applied (
+                key TEXT PRIMARY KEY,
+                applied_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """,
+    ]),
+    # The v7 rebuild dropped AUTOINCREMENT, so a fully pruned ledger restarted
+    # at id 1, below the compaction watermark
+    ("chip ledger AUTOINCREMENT ids", [
+        *_rebuild_table("chip_ledger", """
+            CREATE TABLE chip_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                source TEXT DEFAULT '',
+                ts INTEGER NOT NULL
+            )
+        """, "id, guild_id, user_id, delta, source, ts"),
+        "CREATE INDEX idx_chip_ledger_guild_id ON chip_ledger (guild_id, id)",
+        # Start the sequence past the watermark (LEDGER_WATERMARK_KEY) even if
+        # the ledger was empty when it was copied
+        """
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'chip_ledger', 0
+            WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'chip_ledger')
+        """,
+        """
+            UPDATE sqlite_sequence SET seq = MAX(seq, COALESCE((
+                SELECT CAST(value AS INTEGER) FROM bot_state
+                WHERE guild_id = 0 AND key = 'chip_ledger_compacted_id'
+            ), 0))
+            WHERE name = 'chip_ledger'
+        """,
+    ]),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version() -> int:
+    """Version of the connected database (0 before the first migration)."""
+    async with get_connection() as conn:
+        try:
+            cursor = await conn.execute("SELECT MAX(version) FROM schema_version")
+        except Exception as e:
+            # Anything else (timeout, lost connection) must not read as "unversioned"
+            if "no such table" not in str(e).lower():
+                raise
+            return 0
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def migrate() -> int:
+    """Apply pending migrations in one transaction; returns the new version."""
+    current = await get_schema_version()
+    if current >= SCHEMA_VERSION:
+        return current
+    if _degraded:
+        # The version was read from the replica, and DDL must never be journaled
+        raise DatabaseUnavailable("Cannot migrate while the primary database is unreachable")
+    now = datetime.now(timezone.utc).isoformat()
+    async with batch() as b:
+        b.add("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT DEFAULT '',
+                applied_at TEXT NOT NULL
+            )
         """)
-        await conn.commit()
-        
-        migrations = [
-            "UPDATE bot_state SET key = 'channel_casual' WHERE key = 'channel_spark'",
-            "UPDATE question_usage SET question_type = 'casual' WHERE question_type = 'spark'",
-            "UPDATE bot_state SET key = 'channel_warm' WHERE key = 'channel_casual'",
-            "UPDATE bot_state SET key = 'ping_role_warm' WHERE key = 'ping_role_casual'",
-            "UPDATE bot_state SET key = 'role_picker_message_warm' WHERE key = 'role_picker_message_casual'",
-            "UPDATE bot_state SET key = 'channel_chill' WHERE key = 'channel_personality'",
-            "UPDATE bot_state SET key = 'ping_role_chill' WHERE key = 'ping_role_personality'",
-            "UPDATE bot_state SET key = 'role_picker_message_chill' WHERE key = 'role_picker_message_personality'",
-            "DELETE FROM question_usage WHERE typeof(question_index) = 'integer'",
+        for version, (description, statements) in enumerate(MIGRATIONS[current:], start=current + 1):
+            for sql in statements:
+                b.add(sql)
+            b.add(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, now),
+            )
+    print(f"[DB] Migrated schema from v{current} to v{SCHEMA_VERSION}")
+    return SCHEMA_VERSION
+
+
+async def init():
+    """Bring the schema up to date and warm the in-memory caches"""
+    # For local development (WAL is persisted in the file, so this is one-time)
+    if BACKEND == "sqlite":
+        async with get_connection(write=True) as conn:
+            # Only takes effect on a new, empty file; convert_auto_vacuum() converts older ones
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor = await conn.execute("PRAGMA journal_mode=WAL")
+            await cursor.fetchall()  # finish the statement so it releases its lock
+
+    await migrate()
+    if _journal_size():
+        # Writes journaled during an outage that outlived the last run
+        await replay_journal()
+
+    await load_state_cache()
+    await load_game_mirror()
+    invalidate_rank_cache()
+    _start_compactor()
+    await _start_replica()
+
+
+# ==================== USER DIRECTORY ====================
+
+# Display names live in user_directory and are only written when they change.
+# _directory remembers the last name seen per (guild_id, user_id); members not
+# seen since startup are written once with a conditional upsert that leaves
+# the row alone if SQL already has the name.
+_directory: dict[tuple[str, str], str] = {}
+# Changed names waiting to ride along with the next counter/ledger flush
+_directory_dirty: dict[tuple[str, str], str] = {}
+
+_DIRECTORY_UPSERT = """
+    INSERT INTO user_directory (guild_id, user_id, username, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+    username = excluded.username, updated_at = excluded.updated_at
+    WHERE username != excluded.username
+"""
+
+
+def _note_username(guild_id: str, user_id: str, username: str | None):
+    """Record the name a member was last seen with; queues a write only if it changed."""
+    if username is None:
+        return
+    key = (guild_id, user_id)
+    if _directory.get(key) == username:
+        return
+    _directory[key] = username
+    _directory_dirty[key] = username
+    ranks = _rank_caches.get(guild_id)
+    if ranks is not None and user_id in ranks.chips:
+        ranks.usernames[user_id] = username
+
+
+def _queue_directory(b: "Batch") -> dict[tuple[str, str], str]:
+    """Move pending name changes into a batch. Pass the result to _requeue_directory if it fails."""
+    global _directory_dirty
+    pending, _directory_dirty = _directory_dirty, {}
+    now = _now_ms()
+    for (guild_id, user_id), username in pending.items():
+        b.add(_DIRECTORY_UPSERT, (_id(guild_id), _id(user_id), username, now))
+    return pending
+
+
+def _requeue_directory(pending: dict[tuple[str, str], str]):
+    for key, username in pending.items():
+        _directory_dirty.setdefault(key, username)  # a newer change wins
+
+
+async def flush_directory():
+    """Write pending display-name changes (no-op when nothing changed)."""
+    if not _directory_dirty:
+        return
+    pending = {}
+    try:
+        async with batch() as b:
+            pending = _queue_directory(b)
+    except Exception:
+        _requeue_directory(pending)
+        raise
+
+
+# ==================== RANK CACHE ====================
+
+class GuildRanks:
+    """Chip balances for one guild, kept sorted for O(log n) rank lookups.
+
+    _order holds (-chips, user_id) so the richest user sorts first and the
+    number of users strictly richer than a balance is a single bisect.
+    """
+    def __init__(self, rows):
+        self.chips: dict[str, int] = {}
+        self.usernames: dict[str, str] = {}
+        for user_id, username, chips in rows:
+            self.chips[str(user_id)] = chips
+            self.usernames[str(user_id)] = username
+        self._order = sorted((-chips, user_id) for user_id, chips in self.chips.items())
+
+    def update(self, user_id: str, username: str | None, chips: int):
+        old = self.chips.get(user_id)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, user_id))]
+        insort(self._order, (-chips, user_id))
+        self.chips[user_id] = chips
+        if username is not None:
+            self.usernames[user_id] = username
+        elif user_id not in self.usernames:
+            self.usernames[user_id] = ""
+
+    def rank(self, user_id: str) -> int | None:
+        chips = self.chips.get(user_id, 0)
+        if chips <= 0:
+            return None
+        return bisect_left(self._order, (-chips, "")) + 1
+
+    def top(self, limit: int) -> list[dict]:
+        return [
+            {"user_id": user_id, "username": self.usernames[user_id], "chips": -neg_chips}
+            for neg_chips, user_id in self._order[:limit]
         ]
-        for sql in migrations:
-            await conn.execute(sql)
-        await conn.commit()
 
 
-# ==================== USERS / CHIPS ====================
+# guild_id -> GuildRanks, built from users on first use and updated by every chip write
+_rank_caches: dict[str, GuildRanks] = {}
 
-async def ensure_user(guild_id: str, user_id: str, username: str):
-    async with get_connection() as conn:
-        await conn.execute(
-            """INSERT INTO users (guild_id, user_id, username, chips, created_at)
-               VALUES (?, ?, ?, 0, ?)
-               ON CONFLICT(guild_id, user_id) DO UPDATE SET username = excluded.username""",
-            (guild_id, user_id, username, datetime.now(timezone.utc).isoformat())
+
+async def _guild_ranks(guild_id: str) -> GuildRanks:
+    ranks = _rank_caches.get(guild_id)
+    if ranks is not None:
+        return ranks
+    await flush_ledger()
+    # Build through the writer so no chip write can land between the read and the fill
+    async with get_connection(write=True) as conn:
+        watermark = await _ledger_watermark()
+        cursor = await conn.execute(
+            """SELECT u.user_id, COALESCE(n.username, ''), u.chips + COALESCE(d.total, 0)
+               FROM users u LEFT JOIN (
+                   SELECT user_id, SUM(delta) AS total FROM chip_ledger
+                   WHERE guild_id = ? AND id > ? GROUP BY user_id
+               ) d ON d.user_id = u.user_id
+               LEFT JOIN user_directory n ON n.guild_id = u.guild_id AND n.user_id = u.user_id
+               WHERE u.guild_id = ?""",
+            (_id(guild_id), watermark, _id(guild_id))
         )
-        await conn.commit()
+        rows = await cursor.fetchall()
+        ranks = _rank_caches.setdefault(guild_id, GuildRanks(rows))
+    for user_id, username, _ in rows:
+        if username:
+            _directory.setdefault((guild_id, str(user_id)), username)
+    for key, username in _directory_dirty.items():
+        if key[0] == guild_id and key[1] in ranks.chips:
+            ranks.usernames[key[1]] = username
+    return ranks
+
+
+def _rank_update(guild_id: str, user_id: str, username: str | None, chips: int):
+    ranks = _rank_caches.get(guild_id)
+    if ranks is not None:
+        ranks.update(user_id, username, chips)
+
+
+def invalidate_rank_cache(guild_id: str | None = None):
+    """Drop cached ranks (one guild or all) so they are rebuilt from SQL on next use."""
+    if guild_id is None:
+        _rank_caches.clear()
+    else:
+        _rank_caches.pop(guild_id, None)
 
 
-async def add_chips(guild_id: str, user_id: str, username: str, amount: int):
-    await ensure_user(guild_id, user_id, username)
+async def check_rank_cache(guild_id: str) -> list[str]:
+    """Compare the rank cache for a guild against SQL. Returns mismatches (empty = consistent)."""
+    ranks = await _guild_ranks(guild_id)
+    await flush_ledger()
+    await flush_directory()
     async with get_connection() as conn:
+        watermark = await _ledger_watermark()
+        # Effective balance = compacted users.chips + ledger rows past the watermark
+        cursor = await conn.execute(
+            """SELECT user_id, username, chips, RANK() OVER (ORDER BY chips DESC) FROM (
+                   SELECT u.user_id, COALESCE(n.username, '') AS username, u.chips + COALESCE(d.total, 0) AS chips
+                   FROM users u LEFT JOIN (
+                       SELECT user_id, SUM(delta) AS total FROM chip_ledger
+                       WHERE guild_id = ? AND id > ? GROUP BY user_id
+                   ) d ON d.user_id = u.user_id
+                   LEFT JOIN user_directory n ON n.guild_id = u.guild_id AND n.user_id = u.user_id
+                   WHERE u.guild_id = ?
+               )""",
+            (_id(guild_id), watermark, _id(guild_id))
+        )
+        rows = [(str(r[0]), *r[1:]) for r in await cursor.fetchall()]
+    problems = []
+    if len(rows) != len(ranks.chips):
+        problems.append(f"user count: sql={len(rows)} cache={len(ranks.chips)}")
+    for user_id, username, chips, sql_rank in rows:
+        if ranks.chips.get(user_id) != chips:
+            problems.append(f"{user_id} chips: sql={chips} cache={ranks.chips.get(user_id)}")
+        if ranks.usernames.get(user_id) != username:
+            problems.append(f"{user_id} username: sql={username!r} cache={ranks.usernames.get(user_id)!r}")
+        expected = sql_rank if chips > 0 else None
+        if ranks.rank(user_id) != expected:
+            problems.append(f"{user_id} rank: sql={expected} cache={ranks.rank(user_id)}")
+    if len(ranks._order) != len(ranks.chips) or ranks._order != sorted(ranks._order):
+        problems.append("sorted order is corrupt")
+    return problems
+
+
+# ==================== CHIP LEDGER ====================
+
+# Chip movements are appended to chip_ledger in batches instead of updating
+# users.chips in place. Balances are read from the rank cache, which already
+# includes unflushed and uncompacted deltas; the compactor periodically folds
+# ledger rows past the watermark into users.chips. Ledger ids are AUTOINCREMENT,
+# so a row inserted after old rows are deleted can never land at or below it.
+LEDGER_FLUSH_SECONDS = 2
+LEDGER_FLUSH_EVENTS = 100
+LEDGER_COMPACT_SECONDS = 300
+# Global bot_state key (guild_id '', stored as 0) holding the last ledger id folded into users.chips
+LEDGER_WATERMARK_KEY = "chip_ledger_compacted_id"
+
+# (guild_id, user_id, delta, source, ts) waiting to be inserted
+_ledger_pending: list[tuple] = []
+_ledger_lock = asyncio.Lock()
+_ledger_wake = asyncio.Event()
+_ledger_task: asyncio.Task | None = None
+_compactor_task: asyncio.Task | None = None
+
+
+def _append_ledger(guild_id: str, user_id: str, delta: int, source: str):
+    global _ledger_task
+    _ledger_pending.append(
+        (guild_id, user_id, delta, source, _now_ms())
+    )
+    if len(_ledger_pending) >= LEDGER_FLUSH_EVENTS:
+        _ledger_wake.set()
+    if _ledger_task is None or _ledger_task.done():
+        _ledger_task = _spawn(_ledger_flush_loop())
+
+
+async def _ledger_flush_loop():
+    """Flush the ledger batch on a timer (or early when woken) until it drains."""
+    while _ledger_pending:
+        try:
+            await asyncio.wait_for(_ledger_wake.wait(), LEDGER_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _ledger_wake.clear()
+        try:
+            await flush_ledger()
+        except Exception as e:
+            print(f"[DB] Ledger flush failed, will retry: {e}")
+
+
+async def flush_ledger():
+    """Insert all pending ledger entries (creating new users) in one transaction."""
+    async with _ledger_lock:
+        await _flush_ledger_locked()
+
+
+async def _flush_ledger_locked():
+    """flush_ledger() for a caller already holding _ledger_lock."""
+    global _ledger_pending
+    if not _ledger_pending:
+        return
+    pending, _ledger_pending = _ledger_pending, []
+    names = {}
+    try:
+        async with batch() as b:
+            # Compaction needs every user row to exist
+            users = {(e[0], e[1]): e[4] for e in pending}
+            for (guild_id, user_id), ts in users.items():
+                b.add(
+                    """INSERT INTO users (guild_id, user_id, chips, created_at) VALUES (?, ?, 0, ?)
+                       ON CONFLICT(guild_id, user_id) DO NOTHING""",
+                    (_id(guild_id), _id(user_id), ts)
+                )
+            for guild_id, user_id, delta, source, ts in pending:
+                b.add(
+                    "INSERT INTO chip_ledger (guild_id, user_id, delta, source, ts) VALUES (?, ?, ?, ?, ?)",
+                    (_id(guild_id), _id(user_id), delta, source, ts)
+                )
+            names = _queue_directory(b)
+    except Exception:
+        _ledger_pending[:0] = pending
+        _requeue_directory(names)
+        raise
+
+
+async def _ledger_watermark() -> int:
+    return int(await get_state("", LEDGER_WATERMARK_KEY) or 0)
+
+
+async def compact_ledger() -> int:
+    """Fold ledger rows past the watermark into users.chips. Returns the rows folded."""
+    await flush_ledger()
+    if _degraded:
+        return 0  # The ledger ids to fold only exist on the primary
+    async with get_connection(write=True) as conn:
+        watermark = await _ledger_watermark()
+        cursor = await conn.execute("SELECT MAX(id) FROM chip_ledger")
+        row = await cursor.fetchone()
+        top = row[0] or 0
+        if top <= watermark:
+            return 0
         await conn.execute(
-            "UPDATE users SET chips = chips + ? WHERE guild_id = ? AND user_id = ?",
-            (amount, guild_id, user_id)
+            """UPDATE users SET chips = users.chips + d.total
+               FROM (
+                   SELECT guild_id, user_id, SUM(delta) AS total FROM chip_ledger
+                   WHERE id > ? AND id <= ? GROUP BY guild_id, user_id
+               ) AS d
+               WHERE users.guild_id = d.guild_id AND users.user_id = d.user_id""",
+            (watermark, top)
+        )
+        await conn.execute(
+            """INSERT INTO bot_state (guild_id, key, value) VALUES (0, ?, ?)
+               ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value""",
+            (LEDGER_WATERMARK_KEY, str(top))
         )
         await conn.commit()
+        _cache_states("", {LEDGER_WATERMARK_KEY: str(top)})
+    return top - watermark
 
 
-async def set_chips(guild_id: str, user_id: str, username: str, amount: int):
-    await ensure_user(guild_id, user_id, username)
-    async with get_connection() as conn:
+async def _compactor_loop():
+    while True:
+        await asyncio.sleep(LEDGER_COMPACT_SECONDS)
+        try:
+            folded = await compact_ledger()
+            if folded:
+                print(f"[DB] Compacted {folded} chip ledger rows")
+        except Exception as e:
+            print(f"[DB] Ledger compaction failed: {e}")
+
+
+def _start_compactor():
+    global _compactor_task
+    if _compactor_task is None or _compactor_task.done():
+        _compactor_task = _spawn(_compactor_loop())
+
+
+# ==================== USERS / CHIPS ====================
+
+async def ensure_user(guild_id: str, user_id: str, username: str):
+    async with get_connection(write=True) as conn:
         await conn.execute(
-            "UPDATE users SET chips = ? WHERE guild_id = ? AND user_id = ?",
-            (amount, guild_id, user_id)
+            """INSERT INTO users (guild_id, user_id, chips, created_at) VALUES (?, ?, 0, ?)
+               ON CONFLICT(guild_id, user_id) DO NOTHING""",
+            (_id(guild_id), _id(user_id), _now_ms())
         )
         await conn.commit()
+        ranks = _rank_caches.get(guild_id)
+        if ranks is not None and user_id not in ranks.chips:
+            ranks.update(user_id, username, 0)
+    _note_username(guild_id, user_id, username)
+    await flush_directory()
+
+
+async def add_chips(guild_id: str, user_id: str, username: str, amount: int, source: str = "other") -> int:
+    """Add (or subtract) chips, creating the user if needed. Returns the new balance.
+
+    The balance changes in the rank cache right away; the delta is persisted
+    through the chip ledger, tagged with `source`.
+    """
+    ranks = await _guild_ranks(guild_id)
+    balance = ranks.chips.get(user_id, 0) + amount
+    ranks.update(user_id, username, balance)
+    _note_username(guild_id, user_id, username)
+    _append_ledger(guild_id, user_id, amount, source)
+    return balance
+
+
+async def set_chips(guild_id: str, user_id: str, username: str, amount: int, source: str = "admin"):
+    ranks = await _guild_ranks(guild_id)
+    delta = amount - ranks.chips.get(user_id, 0)
+    ranks.update(user_id, username, amount)
+    _note_username(guild_id, user_id, username)
+    _append_ledger(guild_id, user_id, delta, source)
+
+
+async def transfer_chips(guild_id: str, from_user_id: str, from_username: str,
+                         to_user_id: str, to_username: str, amount: int,
+                         source: str = "donation") -> dict:
+    """Atomically move chips between users.
+
+    The debit only applies if the sender has at least `amount` chips; the
+    recipient is created if needed. Both ledger entries land in the same
+    flush. Returns {"ok", "sender_balance", "recipient_balance"}; when the
+    sender can't afford it ok is False, nothing is changed and the balances
+    are the current ones. Raises ValueError for a transfer to oneself or a
+    non-positive amount.
+    """
+    if from_user_id == to_user_id:
+        raise ValueError("Cannot transfer chips to the same user")
+    if amount <= 0:
+        raise ValueError(f"Transfer amount must be positive, got {amount}")
+    ranks = await _guild_ranks(guild_id)
+    sender = ranks.chips.get(from_user_id, 0)
+    recipient = ranks.chips.get(to_user_id, 0)
+    if sender < amount:
+        return {"ok": False, "sender_balance": sender, "recipient_balance": recipient}
+    recipient += amount
+    ranks.update(from_user_id, from_username, sender - amount)
+    ranks.update(to_user_id, to_username, recipient)
+    _note_username(guild_id, from_user_id, from_username)
+    _note_username(guild_id, to_user_id, to_username)
+    _append_ledger(guild_id, from_user_id, -amount, source)
+    _append_ledger(guild_id, to_user_id, amount, source)
+    return {"ok": True, "sender_balance": sender - amount, "recipient_balance": recipient}
 
 
 async def get_balance(guild_id: str, user_id: str) -> int:
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            "SELECT chips FROM users WHERE guild_id = ? AND user_id = ?",
-            (guild_id, user_id)
-        )
-        row = await cursor.fetchone()
-        return row[0] if row else 0
+    return (await _guild_ranks(guild_id)).chips.get(user_id, 0)
 
 
 async def get_rank(guild_id: str, user_id: str) -> int | None:
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            """SELECT COUNT(*) + 1 FROM users
-               WHERE guild_id = ? AND chips > (
-                   SELECT COALESCE(chips, 0) FROM users WHERE guild_id = ? AND user_id = ?
-               )""",
-            (guild_id, guild_id, user_id)
-        )
-        row = await cursor.fetchone()
-        cursor2 = await conn.execute(
-            "SELECT 1 FROM users WHERE guild_id = ? AND user_id = ? AND chips > 0",
-            (guild_id, user_id)
-        )
-        exists = await cursor2.fetchone()
-        return row[0] if (row and exists) else None
+    return (await _guild_ranks(guild_id)).rank(user_id)
 
 
 async def get_leaderboard(guild_id: str, limit: int = 10) -> list[dict]:
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            "SELECT user_id, username, chips FROM users WHERE guild_id = ? ORDER BY chips DESC LIMIT ?",
-            (guild_id, limit)
-        )
-        rows = await cursor.fetchall()
-        return [{"user_id": r[0], "username": r[1], "chips": r[2]} for r in rows]
+    return (await _guild_ranks(guild_id)).top(limit)
 
 
 async def get_total_users(guild_id: str) -> int:
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            "SELECT COUNT(*) FROM users WHERE guild_id = ?", (guild_id,)
-        )
-        row = await cursor.fetchone()
-        return row[0] if row else 0
+    return len((await _guild_ranks(guild_id)).chips)
+
+
+# ==================== BULK ECONOMY ====================
+
+# Admin operations over many users compile to one INSERT ... SELECT into the
+# chip ledger per chunk of user ids (or a single statement for the whole
+# guild), all in one transaction. Deltas are computed in SQL from effective
+# balances and RETURNed so the rank cache gets exactly what was written.
+# Chunks stay well under SQLite's (and Turso's) bound-parameter limit.
+BULK_CHUNK_SIZE = int(os.environ.get("DB_BULK_CHUNK_SIZE", "500"))
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def _bulk_ledger(guild_id: str, source: str, delta_sql: str, delta_params: tuple,
+                       where_sql: str = "1", where_params: tuple = (),
+                       user_ids: list[str] | None = None, usernames: dict[str, str] | None = None) -> dict:
+    """Append one ledger row per matching user and apply the deltas to the rank cache.
+
+    delta_sql/where_sql are expressions over `chips` (the effective balance).
+    user_ids limits the operation (chunked); None means every user in the guild.
+    """
+    start = time.perf_counter()
+    ranks = await _guild_ranks(guild_id)
+    now = _now_ms()
+    statements = 0
+    applied: list[tuple] = []
+    chunks = list(_chunks(user_ids, BULK_CHUNK_SIZE)) if user_ids is not None else [None]
+    # Flush inside the writer block (ledger lock first, like flush_ledger) so every
+    # chip write issued before the writer was ours is in the balances the deltas are
+    # computed from; later ones stay pending until this commits
+    async with _ledger_lock:
+        async with get_connection(write=True) as conn:
+            await _flush_ledger_locked()  # nested: commits on this same connection
+            watermark = await _ledger_watermark()
+            for chunk in chunks:
+                only = ""
+                ids: tuple = ()
+                if chunk is not None:
+                    ids = tuple(_id(u) for u in chunk)
+                    only = f" AND u.user_id IN ({', '.join(['?'] * len(chunk))})"
+                    if usernames is not None:
+                        # Ledger compaction needs a users row for everyone it credits
+                        await conn.execute(
+                            f"""INSERT INTO users (guild_id, user_id, chips, created_at)
+                                SELECT ?, column1, 0, ? FROM (VALUES {', '.join(['(?)'] * len(chunk))}) WHERE true
+                                ON CONFLICT(guild_id, user_id) DO NOTHING""",
+                            (_id(guild_id), now, *ids)
+                        )
+                        statements += 1
+                cursor = await conn.execute(
+                    f"""INSERT INTO chip_ledger (guild_id, user_id, delta, source, ts)
+                        SELECT ?, user_id, {delta_sql}, ?, ? FROM (
+                            SELECT u.user_id, u.chips + COALESCE(d.total, 0) AS chips
+                            FROM users u LEFT JOIN (
+                                SELECT user_id, SUM(delta) AS total FROM chip_ledger
+                                WHERE guild_id = ? AND id > ? GROUP BY user_id
+                            ) d ON d.user_id = u.user_id
+                            WHERE u.guild_id = ?{only}
+                        ) WHERE ({where_sql}) AND {delta_sql} != 0
+                        RETURNING user_id, delta""",
+                    (_id(guild_id), *delta_params, source, now, _id(guild_id), watermark, _id(guild_id), *ids,
+                     *where_params, *delta_params)
+                )
+                applied.extend(await cursor.fetchall())
+                statements += 1
+            await conn.commit()
+    for user_id, delta in applied:
+        user_id = str(user_id)
+        name = usernames.get(user_id) if usernames else None
+        ranks.update(user_id, name, ranks.chips.get(user_id, 0) + delta)
+        _note_username(guild_id, user_id, name)
+    report = {
+        "rows": len(applied),
+        "chips": sum(delta for _, delta in applied),
+        "statements": statements,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    print(f"[DB] Bulk {source} in guild {guild_id}: {report}")
+    return report
+
+
+async def bulk_add_chips(guild_id: str, usernames: dict[str, str], amount: int,
+                         source: str = "bulk_grant") -> dict:
+    """Give (or take) `amount` chips to every user in {user_id: display name}, creating users as needed.
+
+    Returns {"rows", "chips", "statements", "elapsed_ms"}.
+    """
+    if not usernames or not amount:
+        return {"rows": 0, "chips": 0, "statements": 0, "elapsed_ms": 0.0}
+    return await _bulk_ledger(
+        guild_id, source, "?", (amount,), user_ids=list(usernames), usernames=usernames
+    )
+
+
+async def bulk_decay_chips(guild_id: str, percent: float, min_balance: int = 0,
+                           source: str = "decay") -> dict:
+    """Remove `percent`% (rounded down) of every balance above min_balance, never dropping it below min_balance."""
+    return await _bulk_ledger(
+        guild_id, source, "-MIN(CAST(chips * ? / 100 AS INTEGER), chips - ?)", (percent, min_balance),
+        "chips > ?", (min_balance,)
+    )
+
+
+async def bulk_set_chips(guild_id: str, amount: int, user_ids: list[str] | None = None,
+                         source: str = "season_reset") -> dict:
+    """Set the balance of every user in the guild (or just the existing users in user_ids) to `amount`."""
+    return await _bulk_ledger(guild_id, source, "? - chips", (amount,), user_ids=user_ids)
+
+
+# ==================== COUNTER BUFFER ====================
+
+# Per-message chatter/activity counters are accumulated in memory and written
+# in one transaction every COUNTER_FLUSH_SECONDS or COUNTER_FLUSH_EVENTS events.
+COUNTER_FLUSH_SECONDS = 10
+COUNTER_FLUSH_EVENTS = 200
+
+# (guild_id, user_id, Manila date) -> [chatter delta, activity delta]
+_counter_buffer: dict[tuple[str, str, str], list] = {}
+_counter_events = 0
+_counter_flush_lock = asyncio.Lock()
+_counter_wake = asyncio.Event()
+_counter_task: asyncio.Task | None = None
+
+
+def _buffer_counter(guild_id: str, user_id: str, username: str, chatter: int = 0, activity: int = 0):
+    global _counter_events, _counter_task
+    # Use Manila time for date to match rewards schedule
+    today = datetime.now(MANILA_TZ).strftime("%Y-%m-%d")
+    entry = _counter_buffer.get((guild_id, user_id, today))
+    if entry is None:
+        _counter_buffer[(guild_id, user_id, today)] = [chatter, activity]
+    else:
+        entry[0] += chatter
+        entry[1] += activity
+    _note_username(guild_id, user_id, username)
+    _counter_events += 1
+    if _counter_events >= COUNTER_FLUSH_EVENTS:
+        _counter_wake.set()
+    if _counter_task is None or _counter_task.done():
+        _counter_task = _spawn(_counter_flush_loop())
+
+
+async def _counter_flush_loop():
+    """Flush the buffer on a timer (or early when woken) until it drains."""
+    while _counter_buffer:
+        try:
+            await asyncio.wait_for(_counter_wake.wait(), COUNTER_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _counter_wake.clear()
+        try:
+            await flush_counters()
+        except Exception as e:
+            print(f"[DB] Counter flush failed, will retry: {e}")
+
+
+async def flush_counters():
+    """Write all buffered chatter/activity deltas in a single transaction."""
+    global _counter_buffer, _counter_events
+    async with _counter_flush_lock:
+        if not _counter_buffer:
+            return
+        pending, _counter_buffer = _counter_buffer, {}
+        _counter_events = 0
+        names = {}
+        try:
+            async with batch() as b:
+                for (guild_id, user_id, date), (chatter, activity) in pending.items():
+                    if chatter:
+                        b.add(
+                            """INSERT INTO daily_chatter (guild_id, user_id, message_count, date)
+                               VALUES (?, ?, ?, ?)
+                               ON CONFLICT(guild_id, user_id, date) DO UPDATE SET
+                               message_count = message_count + excluded.message_count""",
+                            (_id(guild_id), _id(user_id), chatter, date)
+                        )
+                for (guild_id, user_id, date), (chatter, activity) in pending.items():
+                    if activity:
+                        b.add(
+                            """INSERT INTO daily_activity (guild_id, user_id, message_points, vc_minutes, date)
+                               VALUES (?, ?, ?, 0, ?)
+                               ON CONFLICT(guild_id, user_id, date) DO UPDATE SET
+                               message_points = message_points + excluded.message_points""",
+                            (_id(guild_id), _id(user_id), activity, date)
+                        )
+                names = _queue_directory(b)
+        except Exception:
+            # Put the deltas back so nothing is lost
+            for key, (chatter, activity) in pending.items():
+                entry = _counter_buffer.setdefault(key, [0, 0])
+                entry[0] += chatter
+                entry[1] += activity
+            _counter_events += len(pending)
+            _requeue_directory(names)
+            raise
 
 
 # ==================== DAILY CHATTER ====================
 
 async def increment_chatter(guild_id: str, user_id: str, username: str):
-    # Use Manila time for date to match rewards schedule
-    today = datetime.now(MANILA_TZ).strftime("%Y-%m-%d")
-    async with get_connection() as conn:
-        await conn.execute(
-            """INSERT INTO daily_chatter (guild_id, user_id, username, message_count, date)
-               VALUES (?, ?, ?, 1, ?)
-               ON CONFLICT(guild_id, user_id, date) DO UPDATE SET
-               message_count = message_count + 1, username = excluded.username""",
-            (guild_id, user_id, username, today)
-        )
-        await conn.commit()
+    """Count a message for chatter rewards (buffered, see flush_counters)."""
+    _buffer_counter(guild_id, user_id, username, chatter=1)
 
 
 async def get_top_chatters(guild_id: str, date: str) -> list[dict]:
+    await flush_counters()  # Rewards must include messages still sitting in the buffer
     async with get_connection() as conn:
         cursor = await conn.execute(
-            """SELECT user_id, username, message_count FROM daily_chatter
-               WHERE guild_id = ? AND date = ?
-               ORDER BY message_count DESC LIMIT 3""",
-            (guild_id, date)
+            """SELECT c.user_id, COALESCE(n.username, ''), c.message_count FROM daily_chatter c
+               LEFT JOIN user_directory n ON n.guild_id = c.guild_id AND n.user_id = c.user_id
+               WHERE c.guild_id = ? AND c.date = ?
+               ORDER BY c.message_count DESC LIMIT 3""",
+            (_id(guild_id), date)
         )
         rows = await cursor.fetchall()
-        return [{"user_id": r[0], "username": r[1], "message_count": r[2]} for r in rows]
+        return [{"user_id": str(r[0]), "username": r[1], "message_count": r[2]} for r in rows]
 
 
 async def clear_daily_chatter(guild_id: str, date: str):
-    async with get_connection() as conn:
+    await flush_counters()  # Otherwise a later flush would resurrect the cleared rows
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "DELETE FROM daily_chatter WHERE guild_id = ? AND date = ?",
-            (guild_id, date)
+            (_id(guild_id), date)
         )
         await conn.commit()
 
@@ -365,10 +2659,10 @@ async def clear_daily_chatter(guild_id: str, date: str):
 
 async def get_used_questions(guild_id: str, question_type: str) -> list[str]:
     """Get list of used question keys (text-based) for a question type."""
-    async with get_connection() as conn:
+    async with replica_connection(guild_id) as conn:
         cursor = await conn.execute(
             "SELECT question_index FROM question_usage WHERE guild_id = ? AND question_type = ?",
-            (guild_id, question_type)
+            (_id(guild_id), question_type)
         )
         rows = await cursor.fetchall()
         return [r[0] for r in rows]
@@ -376,77 +2670,164 @@ async def get_used_questions(guild_id: str, question_type: str) -> list[str]:
 
 async def mark_question_used(guild_id: str, question_type: str, question_key: str):
     """Mark a question as used by its text key."""
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "INSERT INTO question_usage (guild_id, question_type, question_index, used_at) VALUES (?, ?, ?, ?)",
-            (guild_id, question_type, question_key, datetime.now(timezone.utc).isoformat())
+            (_id(guild_id), question_type, question_key, _now_ms())
         )
         await conn.commit()
+    read_your_writes(guild_id)
 
 
 async def reset_questions(guild_id: str, question_type: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "DELETE FROM question_usage WHERE guild_id = ? AND question_type = ?",
-            (guild_id, question_type)
+            (_id(guild_id), question_type)
         )
         await conn.commit()
+    read_your_writes(guild_id)
 
 
 # ==================== BOT STATE ====================
 
-async def get_state(guild_id: str, key: str) -> str | None:
+# guild_id -> {key: value}. A guild present here mirrors ALL of its bot_state
+# rows, so a missing key is a definite None. Loaded by init(); every write
+# path below updates it after committing.
+_state_cache: dict[str, dict[str, str]] = {}
+STATE_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+async def load_state_cache():
+    """Load the whole bot_state table into memory in one query."""
     async with get_connection() as conn:
+        cursor = await conn.execute("SELECT guild_id, key, value FROM bot_state")
+        rows = await cursor.fetchall()
+    _state_cache.clear()
+    for guild_id, key, value in rows:
+        _state_cache.setdefault(_sid(guild_id), {})[key] = value
+
+
+async def _guild_state(guild_id: str) -> dict[str, str]:
+    cached = _state_cache.get(guild_id)
+    if cached is not None:
+        STATE_CACHE_STATS["hits"] += 1
+        return cached
+    STATE_CACHE_STATS["misses"] += 1
+    # Load through the writer so no write can land between the read and the cache fill
+    async with get_connection(write=True) as conn:
         cursor = await conn.execute(
-            "SELECT value FROM bot_state WHERE guild_id = ? AND key = ?",
-            (guild_id, key)
+            "SELECT key, value FROM bot_state WHERE guild_id = ?", (_id(guild_id),)
         )
-        row = await cursor.fetchone()
-        return row[0] if row else None
+        rows = await cursor.fetchall()
+        cached = _state_cache.setdefault(guild_id, {r[0]: r[1] for r in rows})
+    return cached
+
+
+def _cache_states(guild_id: str, updates: dict[str, str]):
+    cached = _state_cache.get(guild_id)
+    if cached is not None:
+        cached.update(updates)
+
+
+async def get_state(guild_id: str, key: str) -> str | None:
+    return (await _guild_state(guild_id)).get(key)
 
 
 async def set_state(guild_id: str, key: str, value: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             """INSERT INTO bot_state (guild_id, key, value) VALUES (?, ?, ?)
                ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value""",
-            (guild_id, key, value)
+            (_id(guild_id), key, value)
         )
         await conn.commit()
+        _cache_states(guild_id, {key: value})
 
 async def get_states(guild_id: str, keys: list[str]) -> dict[str, str | None]:
-    """Fetch multiple state values in a single database roundtrip."""
-    placeholders = ",".join("?" * len(keys))
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            f"SELECT key, value FROM bot_state WHERE guild_id = ? AND key IN ({placeholders})",
-            (guild_id, *keys)
-        )
-        rows = await cursor.fetchall()
-    result = {k: None for k in keys}
-    result.update({r[0]: r[1] for r in rows})
-    return result
+    """Fetch multiple state values (served from the state cache)."""
+    cached = await _guild_state(guild_id)
+    return {k: cached.get(k) for k in keys}
 
 
 async def set_states(guild_id: str, updates: dict[str, str]):
     """Set multiple state keys in a single transaction."""
-    async with get_connection() as conn:
+    async with batch() as b:
         for key, value in updates.items():
-            await conn.execute(
+            b.add(
                 """INSERT INTO bot_state (guild_id, key, value) VALUES (?, ?, ?)
                    ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value""",
-                (guild_id, key, value)
+                (_id(guild_id), key, value)
             )
-        await conn.commit()
+    _cache_states(guild_id, updates)
 
 
 async def delete_state(guild_id: str, key: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "DELETE FROM bot_state WHERE guild_id = ? AND key = ?",
-            (guild_id, key)
+            (_id(guild_id), key)
         )
         await conn.commit()
+        _state_cache.get(guild_id, {}).pop(key, None)
+
+
+# ==================== MESSAGE TRACKING ====================
+
+# Messages closer together than this (per user) don't count towards rewards
+SPAM_WINDOW_SECONDS = 3
+# How often expired entries are swept out of the spam gate
+SPAM_GATE_SWEEP_SECONDS = 60
+
+# guild_id -> {user_id: monotonic time of their last message}. Entries only
+# matter for SPAM_WINDOW_SECONDS, so they are swept instead of persisted: any
+# restart outlasts the window.
+_last_message_at: dict[str, dict[str, float]] = {}
+_spam_gate_swept = time.monotonic()
+
+
+def _check_spam(guild_id: str, user_id: str) -> bool:
+    """Record a message in the spam gate; True if it came too soon after the last one."""
+    global _spam_gate_swept
+    now = time.monotonic()
+    if now - _spam_gate_swept >= SPAM_GATE_SWEEP_SECONDS:
+        _spam_gate_swept = now
+        for guild_id_, users in list(_last_message_at.items()):
+            for user_id_, ts in list(users.items()):
+                if now - ts >= SPAM_WINDOW_SECONDS:
+                    del users[user_id_]
+            if not users:
+                del _last_message_at[guild_id_]
+    users = _last_message_at.setdefault(guild_id, {})
+    prev = users.get(user_id)
+    users[user_id] = now
+    return prev is not None and now - prev < SPAM_WINDOW_SECONDS
+
+
+async def record_message(guild_id: str, user_id: str, username: str, channel_id: str) -> bool:
+    """Track one guild message: spam check, last-message state and reward counters.
+
+    The spam check is an in-memory lookup, the two state keys are written in
+    one upsert/commit and the counter deltas go to the write-behind buffer.
+    Returns True if the message is spam.
+    """
+    is_spam = _check_spam(guild_id, user_id)
+    updates = {
+        "last_message_time": datetime.now(timezone.utc).isoformat(),
+        "last_message_channel": channel_id,
+    }
+    async with get_connection(write=True) as conn:
+        await conn.execute(
+            """INSERT INTO bot_state (guild_id, key, value) VALUES (?, ?, ?), (?, ?, ?)
+               ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value""",
+            tuple(v for key, value in updates.items() for v in (_id(guild_id), key, value))
+        )
+        await conn.commit()
+        _cache_states(guild_id, updates)
+
+    if not is_spam:
+        _buffer_counter(guild_id, user_id, username, chatter=1, activity=1)
+    return is_spam
 
 
 # ==================== CHANNELS ====================
@@ -499,117 +2880,186 @@ async def is_channel_blacklisted(guild_id: str, channel_id: str) -> bool:
     return channel_id in blacklist
 
 
-# ==================== WORD GAME ====================
+# ==================== HOT ROW MIRROR ====================
 
-async def get_word_game(guild_id: str) -> dict | None:
+# At most one chip drop and one word game exist per guild and on_message asks
+# for both on every message, so both tables are mirrored in memory. Loaded by
+# init(); the create/update/delete helpers keep the mirror in sync.
+_chip_drops: dict[str, dict] = {}
+_word_games: dict[str, dict] = {}
+# guild_id -> channel ids with an active chip drop or word game
+_interesting_channels: dict[str, set[str]] = {}
+
+
+async def load_game_mirror():
+    """Load active_chip_drop and word_games into memory (two queries)."""
     async with get_connection() as conn:
         cursor = await conn.execute(
-            "SELECT channel_id, message_id, words, last_contributor_id, word_count, active FROM word_games WHERE guild_id = ?",
-            (guild_id,)
+            "SELECT guild_id, channel_id, message_id, amount, drop_type, answer, created_at FROM active_chip_drop"
         )
-        row = await cursor.fetchone()
-        if not row:
-            return None
-        return {
-            "channel_id": row[0],
-            "message_id": row[1],
-            "words": row[2],
-            "last_contributor_id": row[3],
-            "word_count": row[4],
-            "active": bool(row[5]),
+        drops = await cursor.fetchall()
+        cursor = await conn.execute(
+            "SELECT guild_id, channel_id, message_id, words, last_contributor_id, word_count, active FROM word_games"
+        )
+        games = await cursor.fetchall()
+    _chip_drops.clear()
+    _word_games.clear()
+    for row in drops:
+        _chip_drops[_sid(row[0])] = {
+            "channel_id": _sid(row[1]),
+            "message_id": _sid(row[2]),
+            "amount": row[3],
+            "drop_type": row[4],
+            "answer": row[5],
+            "created_at": _ms_to_iso(row[6]),
+        }
+    for row in games:
+        _word_games[_sid(row[0])] = {
+            "channel_id": _sid(row[1]),
+            "message_id": _sid(row[2]),
+            "words": row[3],
+            "last_contributor_id": _sid(row[4]),
+            "word_count": row[5],
+            "active": bool(row[6]),
         }
+    _interesting_channels.clear()
+    for guild_id in set(_chip_drops) | set(_word_games):
+        _refresh_interesting_channels(guild_id)
+
+
+def _refresh_interesting_channels(guild_id: str):
+    channels = set()
+    drop = _chip_drops.get(guild_id)
+    if drop:
+        channels.add(drop["channel_id"])
+    game = _word_games.get(guild_id)
+    if game and game["active"]:
+        channels.add(game["channel_id"])
+    if channels:
+        _interesting_channels[guild_id] = channels
+    else:
+        _interesting_channels.pop(guild_id, None)
+
+
+def is_interesting_channel(guild_id: str, channel_id: str) -> bool:
+    """True if the channel has an active chip drop or word game."""
+    return channel_id in _interesting_channels.get(guild_id, ())
+
+
+# ==================== WORD GAME ====================
+
+async def get_word_game(guild_id: str) -> dict | None:
+    game = _word_games.get(guild_id)
+    return dict(game) if game else None
 
 
 async def create_word_game(guild_id: str, channel_id: str, message_id: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             """INSERT INTO word_games (guild_id, channel_id, message_id, words, last_contributor_id, word_count, active)
-               VALUES (?, ?, ?, '', '', 0, 1)
+               VALUES (?, ?, ?, '', 0, 0, 1)
                ON CONFLICT(guild_id) DO UPDATE SET
                channel_id = excluded.channel_id, message_id = excluded.message_id,
-               words = '', last_contributor_id = '', word_count = 0, active = 1""",
-            (guild_id, channel_id, message_id)
+               words = '', last_contributor_id = 0, word_count = 0, active = 1""",
+            (_id(guild_id), _id(channel_id), _id(message_id))
         )
         await conn.commit()
+        _word_games[guild_id] = {
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "words": "",
+            "last_contributor_id": "",
+            "word_count": 0,
+            "active": True,
+        }
+        _refresh_interesting_channels(guild_id)
 
 
 async def add_word(guild_id: str, word: str, contributor_id: str, current_words: str):
     new_words = f"{current_words} {word}".strip() if current_words else word
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             """UPDATE word_games SET words = ?, last_contributor_id = ?, word_count = word_count + 1
                WHERE guild_id = ? AND active = 1""",
-            (new_words, contributor_id, guild_id)
+            (new_words, _id(contributor_id), _id(guild_id))
         )
         await conn.commit()
+        game = _word_games.get(guild_id)
+        if game and game["active"]:
+            game["words"] = new_words
+            game["last_contributor_id"] = contributor_id
+            game["word_count"] += 1
 
 
 async def end_word_game(guild_id: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "UPDATE word_games SET active = 0 WHERE guild_id = ?",
-            (guild_id,)
+            (_id(guild_id),)
         )
         await conn.commit()
+        if guild_id in _word_games:
+            _word_games[guild_id]["active"] = False
+            _refresh_interesting_channels(guild_id)
 
 
 async def update_word_game_message(guild_id: str, message_id: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "UPDATE word_games SET message_id = ? WHERE guild_id = ? AND active = 1",
-            (message_id, guild_id)
+            (_id(message_id), _id(guild_id))
         )
         await conn.commit()
+        game = _word_games.get(guild_id)
+        if game and game["active"]:
+            game["message_id"] = message_id
 
 
 # ==================== DAILY ACTIVITY ====================
 
 async def increment_activity_message(guild_id: str, user_id: str, username: str):
-    # Use Manila time for date to match rewards schedule
-    today = datetime.now(MANILA_TZ).strftime("%Y-%m-%d")
-    async with get_connection() as conn:
-        await conn.execute(
-            """INSERT INTO daily_activity (guild_id, user_id, username, message_points, vc_minutes, date)
-               VALUES (?, ?, ?, 1, 0, ?)
-               ON CONFLICT(guild_id, user_id, date) DO UPDATE SET
-               message_points = message_points + 1, username = excluded.username""",
-            (guild_id, user_id, username, today)
-        )
-        await conn.commit()
+    """Count a message point for activity rewards (buffered, see flush_counters)."""
+    _buffer_counter(guild_id, user_id, username, activity=1)
 
 
-async def add_vc_minutes(guild_id: str, user_id: str, username: str, minutes: int):
+async def add_vc_minutes(guild_id: str, user_id: str, username: str | None, minutes: int):
     # Use Manila time for date to match rewards schedule
     today = datetime.now(MANILA_TZ).strftime("%Y-%m-%d")
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
-            """INSERT INTO daily_activity (guild_id, user_id, username, message_points, vc_minutes, date)
-               VALUES (?, ?, ?, 0, ?, ?)
+            """INSERT INTO daily_activity (guild_id, user_id, message_points, vc_minutes, date)
+               VALUES (?, ?, 0, ?, ?)
                ON CONFLICT(guild_id, user_id, date) DO UPDATE SET
-               vc_minutes = vc_minutes + ?, username = excluded.username""",
-            (guild_id, user_id, username, minutes, today, minutes)
+               vc_minutes = vc_minutes + excluded.vc_minutes""",
+            (_id(guild_id), _id(user_id), minutes, today)
         )
         await conn.commit()
+    _note_username(guild_id, user_id, username)
+    await flush_directory()
 
 
 async def get_top_activity(guild_id: str, date: str) -> list[dict]:
+    await flush_counters()
     async with get_connection() as conn:
         cursor = await conn.execute(
-            """SELECT user_id, username, message_points, vc_minutes, (message_points + vc_minutes) as total
-               FROM daily_activity
-               WHERE guild_id = ? AND date = ?
+            """SELECT a.user_id, COALESCE(n.username, ''), a.message_points, a.vc_minutes,
+                      (a.message_points + a.vc_minutes) as total
+               FROM daily_activity a
+               LEFT JOIN user_directory n ON n.guild_id = a.guild_id AND n.user_id = a.user_id
+               WHERE a.guild_id = ? AND a.date = ?
                ORDER BY total DESC LIMIT 3""",
-            (guild_id, date)
+            (_id(guild_id), date)
         )
         rows = await cursor.fetchall()
-        return [{"user_id": r[0], "username": r[1], "message_points": r[2], "vc_minutes": r[3], "total": r[4]} for r in rows]
+        return [{"user_id": str(r[0]), "username": r[1], "message_points": r[2], "vc_minutes": r[3], "total": r[4]} for r in rows]
 
 
 async def clear_daily_activity(guild_id: str, date: str):
-    async with get_connection() as conn:
+    await flush_counters()
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "DELETE FROM daily_activity WHERE guild_id = ? AND date = ?",
-            (guild_id, date)
+            (_id(guild_id), date)
         )
         await conn.commit()
 
@@ -617,42 +3067,38 @@ async def clear_daily_activity(guild_id: str, date: str):
 # ==================== VC SESSIONS ====================
 
 async def start_vc_session(guild_id: str, user_id: str, username: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
-            """INSERT INTO vc_sessions (guild_id, user_id, username, join_time)
-               VALUES (?, ?, ?, ?)
-               ON CONFLICT(guild_id, user_id) DO UPDATE SET
-               join_time = excluded.join_time, username = excluded.username""",
-            (guild_id, user_id, username, datetime.now(timezone.utc).isoformat())
+            """INSERT INTO vc_sessions (guild_id, user_id, join_time) VALUES (?, ?, ?)
+               ON CONFLICT(guild_id, user_id) DO UPDATE SET join_time = excluded.join_time""",
+            (_id(guild_id), _id(user_id), _now_ms())
         )
         await conn.commit()
+    _note_username(guild_id, user_id, username)
+    await flush_directory()
 
 
 async def end_vc_session(guild_id: str, user_id: str) -> int:
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         cursor = await conn.execute(
-            "SELECT username, join_time FROM vc_sessions WHERE guild_id = ? AND user_id = ?",
-            (guild_id, user_id)
+            "SELECT join_time FROM vc_sessions WHERE guild_id = ? AND user_id = ?",
+            (_id(guild_id), _id(user_id))
         )
         row = await cursor.fetchone()
         if not row:
             return 0
         
-        username, join_time = row[0], row[1]
-        join_dt = datetime.fromisoformat(join_time)
-        if join_dt.tzinfo is None:
-            join_dt = join_dt.replace(tzinfo=timezone.utc)
-        
-        minutes = int((datetime.now(timezone.utc) - join_dt).total_seconds() / 60)
+        join_ms = row[0]
+        minutes = (_now_ms() - join_ms) // 60000
         
         await conn.execute(
             "DELETE FROM vc_sessions WHERE guild_id = ? AND user_id = ?",
-            (guild_id, user_id)
+            (_id(guild_id), _id(user_id))
         )
         await conn.commit()
         
         if minutes > 0:
-            await add_vc_minutes(guild_id, user_id, username, minutes)
+            await add_vc_minutes(guild_id, user_id, None, minutes)
         
         return minutes
 
@@ -660,17 +3106,20 @@ async def end_vc_session(guild_id: str, user_id: str) -> int:
 async def get_all_vc_sessions(guild_id: str) -> list[dict]:
     async with get_connection() as conn:
         cursor = await conn.execute(
-            "SELECT user_id, username, join_time FROM vc_sessions WHERE guild_id = ?",
-            (guild_id,)
+            """SELECT s.user_id, COALESCE(n.username, ''), s.join_time FROM vc_sessions s
+               LEFT JOIN user_directory n ON n.guild_id = s.guild_id AND n.user_id = s.user_id
+               WHERE s.guild_id = ?""",
+            (_id(guild_id),)
         )
         rows = await cursor.fetchall()
-        return [{"user_id": r[0], "username": r[1], "join_time": r[2]} for r in rows]
+        return [{"user_id": str(r[0]), "username": r[1], "join_time": _ms_to_iso(r[2])} for r in rows]
 
 
 # ==================== ACTIVE CHIP DROP ====================
 
 async def create_chip_drop(guild_id: str, channel_id: str, message_id: str, amount: int, drop_type: str, answer: str = ""):
-    async with get_connection() as conn:
+    created_ms = _now_ms()
+    async with get_connection(write=True) as conn:
         await conn.execute(
             """INSERT INTO active_chip_drop (guild_id, channel_id, message_id, amount, drop_type, answer, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -678,47 +3127,44 @@ async def create_chip_drop(guild_id: str, channel_id: str, message_id: str, amou
                channel_id = excluded.channel_id, message_id = excluded.message_id,
                amount = excluded.amount, drop_type = excluded.drop_type,
                answer = excluded.answer, created_at = excluded.created_at""",
-            (guild_id, channel_id, message_id, amount, drop_type, answer, datetime.now(timezone.utc).isoformat())
+            (_id(guild_id), _id(channel_id), _id(message_id), amount, drop_type, answer, created_ms)
         )
         await conn.commit()
+        _chip_drops[guild_id] = {
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "amount": amount,
+            "drop_type": drop_type,
+            "answer": answer,
+            "created_at": _ms_to_iso(created_ms),
+        }
+        _refresh_interesting_channels(guild_id)
 
 
 async def get_chip_drop(guild_id: str) -> dict | None:
-    async with get_connection() as conn:
-        cursor = await conn.execute(
-            "SELECT channel_id, message_id, amount, drop_type, answer, created_at FROM active_chip_drop WHERE guild_id = ?",
-            (guild_id,)
-        )
-        row = await cursor.fetchone()
-        if not row:
-            return None
-        return {
-            "channel_id": row[0],
-            "message_id": row[1],
-            "amount": row[2],
-            "drop_type": row[3],
-            "answer": row[4],
-            "created_at": row[5],
-        }
+    drop = _chip_drops.get(guild_id)
+    return dict(drop) if drop else None
 
 
 async def delete_chip_drop(guild_id: str):
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             "DELETE FROM active_chip_drop WHERE guild_id = ?",
-            (guild_id,)
+            (_id(guild_id),)
         )
         await conn.commit()
+        _chip_drops.pop(guild_id, None)
+        _refresh_interesting_channels(guild_id)
 
 
 # ==================== TYPOLOGY PROFILES ====================
 
 async def get_typology_profile(guild_id: str, user_id: str) -> dict | None:
     """Get a user's typology profile."""
-    async with get_connection() as conn:
+    async with replica_connection(guild_id) as conn:
         cursor = await conn.execute(
             "SELECT mbti, enneagram, tritype, instinct, ap, updated_at FROM typology_profiles WHERE guild_id = ? AND user_id = ?",
-            (guild_id, user_id)
+            (_id(guild_id), _id(user_id))
         )
         row = await cursor.fetchone()
         if not row:
@@ -729,7 +3175,7 @@ async def get_typology_profile(guild_id: str, user_id: str) -> dict | None:
             "tritype": row[2] or "",
             "instinct": row[3] or "",
             "ap": row[4] or "",
-            "updated_at": row[5] or "",
+            "updated_at": _ms_to_iso(row[5]),
         }
 
 
@@ -739,27 +3185,27 @@ async def set_typology_field(guild_id: str, user_id: str, field: str, value: str
     if field not in valid_fields:
         raise ValueError(f"Invalid field: {field}")
     
-    async with get_connection() as conn:
+    async with batch() as b:
         # First ensure the row exists
-        await conn.execute(
+        b.add(
             """INSERT INTO typology_profiles (guild_id, user_id, updated_at)
                VALUES (?, ?, ?)
                ON CONFLICT(guild_id, user_id) DO NOTHING""",
-            (guild_id, user_id, datetime.now(timezone.utc).isoformat())
+            (_id(guild_id), _id(user_id), _now_ms())
         )
         # Then update the specific field
-        await conn.execute(
+        b.add(
             f"UPDATE typology_profiles SET {field} = ?, updated_at = ? WHERE guild_id = ? AND user_id = ?",
-            (value, datetime.now(timezone.utc).isoformat(), guild_id, user_id)
+            (value, _now_ms(), _id(guild_id), _id(user_id))
         )
-        await conn.commit()
+    read_your_writes(guild_id)
 
 
 # ==================== D&D INVENTORY ====================
 
 async def dnd_get_inventory(char_key: str) -> dict[str, int]:
     """Return {item_name: amount} for a character (only items with amount > 0)."""
-    async with get_connection() as conn:
+    async with replica_connection() as conn:
         cursor = await conn.execute(
             "SELECT item_name, amount FROM dnd_inventory WHERE char_key = ? AND amount > 0 ORDER BY item_name",
             (char_key,)
@@ -770,7 +3216,7 @@ async def dnd_get_inventory(char_key: str) -> dict[str, int]:
 
 async def dnd_get_all_inventories() -> dict[str, dict[str, int]]:
     """Return {char_key: {item_name: amount}} for all characters."""
-    async with get_connection() as conn:
+    async with replica_connection() as conn:
         cursor = await conn.execute(
             "SELECT char_key, item_name, amount FROM dnd_inventory WHERE amount > 0 ORDER BY char_key, item_name"
         )
@@ -783,7 +3229,7 @@ async def dnd_get_all_inventories() -> dict[str, dict[str, int]]:
 
 async def dnd_add_item(char_key: str, item_name: str, amount: int) -> None:
     """Add `amount` of an item to a character's inventory (upsert)."""
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         await conn.execute(
             """INSERT INTO dnd_inventory (char_key, item_name, amount)
                VALUES (?, ?, ?)
@@ -791,11 +3237,12 @@ async def dnd_add_item(char_key: str, item_name: str, amount: int) -> None:
             (char_key, item_name, amount)
         )
         await conn.commit()
+    read_your_writes()
 
 
 async def dnd_remove_item(char_key: str, item_name: str, amount: int) -> bool:
     """Remove `amount` of an item. Returns False if insufficient stock."""
-    async with get_connection() as conn:
+    async with get_connection(write=True) as conn:
         cursor = await conn.execute(
             "SELECT amount FROM dnd_inventory WHERE char_key = ? AND item_name = ?",
             (char_key, item_name)
@@ -808,4 +3255,320 @@ async def dnd_remove_item(char_key: str, item_name: str, amount: int) -> bool:
             (amount, char_key, item_name)
         )
         await conn.commit()
+    read_your_writes()
     return True
+
+
+# ==================== MAINTENANCE ====================
+
+# Days of history kept per table (None or a missing key = keep forever)
+DEFAULT_RETENTION_DAYS = {
+    "daily_chatter": 14,
+    "daily_activity": 14,
+    "question_usage": None,  # pruning makes used questions eligible again
+    "vc_sessions": 1,
+    "chip_ledger": 30,  # only rows already folded into users.chips
+    "journal_applied": 2,  # one key per Turso write; only needed until a replay finishes
+}
+# Rows deleted per transaction, so the writer is never held for long
+MAINTENANCE_BATCH_SIZE = 500
+# VC sessions younger than this are never treated as orphans (join/leave races)
+VC_ORPHAN_GRACE_MINUTES = 10
+
+LAST_MAINTENANCE: dict = {}
+
+
+def _delete_batched_sql(table: str, keys: str, where: str) -> str:
+    return (
+        f"DELETE FROM {table} WHERE ({keys}) IN "
+        f"(SELECT {keys} FROM {table} WHERE {where} LIMIT {MAINTENANCE_BATCH_SIZE}) RETURNING 1"
+    )
+
+
+async def _delete_batched(table: str, keys: str, where: str, params: tuple) -> int:
+    """Delete matching rows MAINTENANCE_BATCH_SIZE at a time, one commit per batch."""
+    sql = _delete_batched_sql(table, keys, where)
+    total = 0
+    while True:
+        async with get_connection(write=True) as conn:
+            cursor = await conn.execute(sql, params)
+            deleted = len(await cursor.fetchall())
+            await conn.commit()
+        total += deleted
+        if deleted < MAINTENANCE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(0)  # let queued writers in between batches
+
+
+async def _prune_vc_sessions(days: int | None, active_vc: dict[str, set[str]] | None) -> int:
+    """Drop sessions whose leave event was missed (e.g. the bot was down)."""
+    if active_vc is not None:
+        cutoff = _now_ms() - VC_ORPHAN_GRACE_MINUTES * 60_000
+    elif days is not None:
+        cutoff = _now_ms() - days * 86_400_000
+    else:
+        return 0
+    async with get_connection() as conn:
+        cursor = await conn.execute(
+            "SELECT guild_id, user_id FROM vc_sessions WHERE join_time < ?", (cutoff,)
+        )
+        rows = await cursor.fetchall()
+    if active_vc is not None:
+        rows = [r for r in rows if str(r[1]) not in active_vc.get(str(r[0]), ())]
+    if not rows:
+        return 0
+    async with batch() as b:
+        for guild_id, user_id in rows:
+            b.add("DELETE FROM vc_sessions WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+    return len(rows)
+
+
+async def _compact_file() -> dict:
+    """Return free pages to the OS and truncate the WAL (local SQLite only)."""
+    async with get_connection(write=True) as conn:
+        cursor = await conn.execute("PRAGMA auto_vacuum")
+        incremental = (await cursor.fetchone())[0] == 2
+        cursor = await conn.execute("PRAGMA freelist_count")
+        free_before = (await cursor.fetchone())[0]
+        if incremental:
+            cursor = await conn.execute("PRAGMA incremental_vacuum")
+            await cursor.fetchall()
+        cursor = await conn.execute("PRAGMA freelist_count")
+        free_after = (await cursor.fetchone())[0]
+        cursor = await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        busy, wal_pages, checkpointed = await cursor.fetchone()
+    return {
+        "pages_freed": free_before - free_after,
+        # Older files need a one-time convert_auto_vacuum() before pages can be freed
+        "incremental_vacuum": incremental,
+        "checkpoint": {"busy": bool(busy), "wal_pages": wal_pages, "checkpointed": checkpointed},
+    }
+
+
+async def convert_auto_vacuum() -> dict:
+    """Switch an older local file to auto_vacuum=INCREMENTAL with a full VACUUM.
+
+    An admin action, not part of run_maintenance: the VACUUM rewrites the
+    whole file while holding the writer. Returns the file size before/after.
+    """
+    if BACKEND != "sqlite":
+        raise RuntimeError("Only local SQLite files can be vacuumed")
+    start = time.perf_counter()
+    async with get_connection(write=True) as conn:
+        cursor = await conn.execute("PRAGMA auto_vacuum")
+        already = (await cursor.fetchone())[0] == 2
+        bytes_before = os.path.getsize(DB_PATH)
+        if not already:
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.execute("VACUUM")
+            await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {
+        "converted": not already,
+        "bytes_before": bytes_before,
+        "bytes_after": os.path.getsize(DB_PATH),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+async def run_maintenance(retention: dict[str, int | None] | None = None,
+                          active_vc: dict[str, set[str]] | None = None) -> dict:
+    """Apply per-table retention, then vacuum and checkpoint. Returns a report.
+
+    retention overrides DEFAULT_RETENTION_DAYS per table. active_vc maps
+    guild_id -> user_ids currently in voice; when given, any older session
+    for someone not in voice is dropped instead of waiting out the retention.
+    """
+    days = {**DEFAULT_RETENTION_DAYS, **(retention or {})}
+    start = time.perf_counter()
+    now_ms = _now_ms()
+    today = datetime.now(MANILA_TZ).date()
+    rows: dict[str, int] = {}
+
+    for table in ("daily_chatter", "daily_activity"):
+        if days.get(table) is not None:
+            cutoff = (today - timedelta(days=days[table])).isoformat()
+            rows[table] = await _delete_batched(table, "guild_id, date, user_id", "date < ?", (cutoff,))
+
+    if days.get("question_usage") is not None:
+        cutoff = now_ms - days["question_usage"] * 86_400_000
+        rows["question_usage"] = await _delete_batched(
+            "question_usage", "id", "used_at > 0 AND used_at < ?", (cutoff,)
+        )
+
+    rows["vc_sessions"] = await _prune_vc_sessions(days.get("vc_sessions"), active_vc)
+
+    if days.get("chip_ledger") is not None:
+        cutoff = now_ms - days["chip_ledger"] * 86_400_000
+        rows["chip_ledger"] = await _delete_batched(
+            "chip_ledger", "id", "id <= ? AND ts < ?", (await _ledger_watermark(), cutoff)
+        )
+
+    if days.get("journal_applied") is not None:
+        cutoff = now_ms - days["journal_applied"] * 86_400_000
+        rows["journal_applied"] = await _delete_batched(
+            "journal_applied", "key", "applied_at < ?", (cutoff,)
+        )
+
+    report = {"rows": rows, "total_rows": sum(rows.values())}
+    if BACKEND == "sqlite":
+        # Turso manages its own storage, and in-memory databases have no file
+        report.update(await _compact_file())
+    report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    LAST_MAINTENANCE.clear()
+    LAST_MAINTENANCE.update(report)
+    print(f"[DB] Maintenance reclaimed {report['total_rows']} rows in {report['elapsed_ms']}ms: {rows}")
+    return report
+
+
+# ==================== BACKUPS ====================
+
+BACKUP_DIR = os.environ.get(
+    "DB_BACKUP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "backups")
+)
+BACKUP_KEEP = int(os.environ.get("DB_BACKUP_KEEP", "7"))
+# Pages copied per backup step, and the pause between steps (lets writers in)
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+BACKUP_PREFIX = "bot_data-"
+BACKUP_SUFFIX = ".db.gz"
+
+
+def _copy_snapshot(dest_path: str):
+    """Incremental online backup of DB_PATH into dest_path (runs in a thread)."""
+    src = sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(dest_path)
+    try:
+        # Hold one read transaction for the whole copy: the WAL keeps this
+        # snapshot stable, so concurrent commits neither block nor restart it
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        src.rollback()
+    finally:
+        dst.close()
+        src.close()
+
+
+def _gzip_file(src_path: str, dest_path: str):
+    with open(src_path, "rb") as src, gzip.open(dest_path, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def _gunzip_file(src_path: str, dest_path: str):
+    with gzip.open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def list_backups() -> list[str]:
+    """Snapshot file paths, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    names = [n for n in os.listdir(BACKUP_DIR) if n.startswith(BACKUP_PREFIX) and n.endswith(BACKUP_SUFFIX)]
+    paths = [os.path.join(BACKUP_DIR, n) for n in names]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def _rotate_backups(keep: int) -> list[str]:
+    removed = list_backups()[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+async def create_backup(keep: int | None = None) -> dict:
+    """Write a compressed, timestamped snapshot and rotate old ones. Returns a report."""
+    if BACKEND != "sqlite":
+        raise RuntimeError("Backups are only available for the local SQLite database")
+    start = time.perf_counter()
+    await flush_counters()
+    await flush_ledger()
+    await flush_directory()
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(BACKUP_DIR, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+    n = 1
+    while os.path.exists(path):  # more than one snapshot in the same second
+        path = os.path.join(BACKUP_DIR, f"{BACKUP_PREFIX}{stamp}-{n}{BACKUP_SUFFIX}")
+        n += 1
+    raw_path = path + ".tmp-db"
+    try:
+        await asyncio.to_thread(_copy_snapshot, raw_path)
+        raw_size = os.path.getsize(raw_path)
+        await asyncio.to_thread(_gzip_file, raw_path, path + ".tmp")
+        os.replace(path + ".tmp", path)
+    finally:
+        for leftover in (raw_path, path + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    removed = _rotate_backups(BACKUP_KEEP if keep is None else keep)
+    report = {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "raw_bytes": raw_size,
+        "rotated": [os.path.basename(p) for p in removed],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    print(f"[DB] Backup written: {os.path.basename(path)} "
+          f"({report['bytes']} bytes, {report['elapsed_ms']}ms, rotated {len(removed)})")
+    return report
+
+
+def _validate_snapshot(path: str) -> int:
+    """Check a decompressed snapshot; returns its schema version."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise ValueError(f"Snapshot failed integrity check: {result}")
+        try:
+            version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+        except sqlite3.DatabaseError:
+            version = 0
+    finally:
+        conn.close()
+    if version < 1:
+        raise ValueError("Snapshot has no schema_version; it predates versioned migrations")
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Snapshot is schema v{version}, this build only knows v{SCHEMA_VERSION}")
+    return version
+
+
+def _restore_into_live(snapshot_path: str):
+    src = sqlite3.connect(snapshot_path)
+    dst = sqlite3.connect(DB_PATH)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP)
+    finally:
+        dst.close()
+        src.close()
+
+
+async def restore_backup(path: str) -> dict:
+    """Replace the live database with a snapshot after validating it.
+
+    The snapshot must carry a schema version this build knows; older ones are
+    migrated forward by init(). Buffered writes are flushed into the current
+    database first and then discarded with it.
+    """
+    if BACKEND != "sqlite":
+        raise RuntimeError("Backups are only available for the local SQLite database")
+    start = time.perf_counter()
+    raw_path = os.path.join(BACKUP_DIR, f".restore-{os.getpid()}.db")
+    try:
+        await asyncio.to_thread(_gunzip_file, path, raw_path)
+        version = await asyncio.to_thread(_validate_snapshot, raw_path)
+        await close()  # flush buffers, stop background tasks, release pooled connections
+        await asyncio.to_thread(_restore_into_live, raw_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    await init()  # migrate if needed and rebuild every in-memory cache
+    report = {
+        "path": path,
+        "schema_version": version,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    print(f"[DB] Restored {os.path.basename(path)} (schema v{version}) in {report['elapsed_ms']}ms")
+    return report
@@ -0,0 +1,256 @@
+"""
+Behaviour tests for db.py on real SQLite files (no network, no Discord).
+
+Each test drives the public helpers through configure()/init()/close(), so
+"restart" means closing the module and opening the same file again. The
+Turso path runs over benchmarks/fake_libsql.py.
+Run from the repository root: python -m pytest -q tests
+"""
+
+import os
+import sys
+import math
+import asyncio
+import sqlite3
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import db  # noqa: E402
+import fake_libsql  # noqa: E402
+
+GUILD = "1"
+
+
+async def _start(path: str):
+    db.configure("sqlite", path=path)
+    await db.init()
+
+
+def test_pruned_ledger_ids_stay_past_watermark(tmp_path):
+    """Prune every compacted ledger row, insert, restart: the new delta survives."""
+    path = str(tmp_path / "bot.db")
+
+    async def scenario():
+        await _start(path)
+        for _ in range(5):
+            await db.add_chips(GUILD, "7", "seven", 100)
+        assert await db.compact_ledger() == 5
+        await asyncio.sleep(0.01)  # every folded row is now older than the cutoff
+        report = await db.run_maintenance({"chip_ledger": 0})
+        assert report["rows"]["chip_ledger"] == 5
+        await db.add_chips(GUILD, "7", "seven", 50)
+        await db.close()
+
+        await _start(path)
+        try:
+            assert await db.get_balance(GUILD, "7") == 550
+            assert await db.check_rank_cache(GUILD) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+# Values whose inlined literal must read back exactly like the bound parameter
+INLINE_VALUES = [
+    0, 5, -5, 2**63 - 1, -2**63, True, None,
+    1.5, -1.5, -0.0, 1e300, -1e-300,
+    "", "it's", "'; DROP TABLE t; --", "-- not a comment", "/* nor this */", "?", "naïve ✓",
+    b"", b"\x00\xff'",
+]
+
+
+def test_inlined_literals_match_bound_parameters():
+    conn = sqlite3.connect(":memory:")
+    for value in INLINE_VALUES:
+        inlined = db._inline_params("SELECT ?, typeof(?)", (value, value))
+        assert inlined is not None, value
+        assert conn.execute(inlined).fetchone() == conn.execute("SELECT ?, typeof(?)", (value, value)).fetchone()
+
+
+def test_inlined_negative_after_minus_is_not_a_comment():
+    conn = sqlite3.connect(":memory:")
+    for value in (-5, -2.5, -2**63):
+        inlined = db._inline_params("SELECT 10 -?, 1", (value,))
+        assert conn.execute(inlined).fetchone() == conn.execute("SELECT 10 -?, 1", (value,)).fetchone()
+
+
+def test_values_without_exact_literal_are_not_inlined():
+    for value in (math.nan, math.inf, -math.inf, "a\x00b", 2**63, -2**63 - 1, object()):
+        assert db._inline_params("SELECT ?", (value,)) is None
+    # Placeholders inside strings, quoted names and comments are left alone
+    sql = "SELECT '?', \"?\", ? -- ?\n/* ? */"
+    assert db._inline_params(sql, (-1,)) == "SELECT '?', \"?\", (-1) -- ?\n/* ? */"
+    assert db._inline_params("SELECT ?1", (1,)) is None
+    assert db._inline_params("SELECT ?, ?", (1,)) is None
+
+
+def test_batch_script_runs_every_statement():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (k TEXT, v)")
+    script = db._batch_script([
+        ("INSERT INTO t (k, v) VALUES (?, ?) -- trailing comment", [("a", -1), ("b'; --", b"\x00")]),
+        ("UPDATE t SET v = v -? WHERE k = ?", [(-4, "a")]),
+    ])
+    conn.executescript(script)
+    assert conn.execute("SELECT k, v FROM t ORDER BY k").fetchall() == [("a", 3), ("b'; --", b"\x00")]
+
+
+def test_bulk_set_includes_chip_writes_queued_before_it(tmp_path):
+    """A chip write issued while /resetchips waits for the writer is reset too."""
+    path = str(tmp_path / "bot.db")
+
+    async def scenario():
+        await _start(path)
+        try:
+            for user_id in ("7", "8"):
+                await db.add_chips(GUILD, user_id, f"user{user_id}", 100)
+            await db.flush_ledger()
+            release = asyncio.Event()
+
+            async def hold_writer():
+                async with db.get_connection(write=True):
+                    await release.wait()
+
+            holder = asyncio.create_task(hold_writer())
+            await asyncio.sleep(0)
+            reset = asyncio.create_task(db.bulk_set_chips(GUILD, 1000))
+            await asyncio.sleep(0.01)  # reset is now waiting for the writer
+            await db.add_chips(GUILD, "7", "user7", 25)
+            release.set()
+            await holder
+            report = await reset
+            assert report["rows"] == 2
+            await db.compact_ledger()
+            assert [await db.get_balance(GUILD, u) for u in ("7", "8")] == [1000, 1000]
+            assert await db.check_rank_cache(GUILD) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_transfer_returns_both_balances(tmp_path):
+    async def scenario():
+        await _start(str(tmp_path / "bot.db"))
+        try:
+            await db.add_chips(GUILD, "7", "user7", 100)
+            result = await db.transfer_chips(GUILD, "7", "user7", "8", "user8", 30)
+            assert result == {"ok": True, "sender_balance": 70, "recipient_balance": 30}
+            result = await db.transfer_chips(GUILD, "7", "user7", "8", "user8", 71)
+            assert result == {"ok": False, "sender_balance": 70, "recipient_balance": 30}
+            assert [await db.get_balance(GUILD, u) for u in ("7", "8")] == [70, 30]
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+async def _spend(users: list[str], bulk: bool = True):
+    """Mixed chip traffic: per-user adds, a donation and (unless bulk=False) a bulk decay."""
+    for i, user_id in enumerate(users):
+        await db.add_chips(GUILD, user_id, f"user{user_id}", 100 * (i + 1))
+    await db.transfer_chips(GUILD, users[-1], f"user{users[-1]}", users[0], f"user{users[0]}", 150)
+    await db.add_chips(GUILD, users[1], f"user{users[1]}", -50)
+    if bulk:
+        await db.bulk_decay_chips(GUILD, 10)
+
+
+def test_rank_cache_consistent_after_compaction_and_maintenance(tmp_path):
+    path = str(tmp_path / "bot.db")
+    users = [str(10 + i) for i in range(6)]
+
+    async def scenario():
+        await _start(path)
+        try:
+            await _spend(users)
+            assert await db.check_rank_cache(GUILD) == []
+            await db.compact_ledger()
+            await asyncio.sleep(0.01)
+            await db.run_maintenance({"chip_ledger": 0})
+            assert await db.check_rank_cache(GUILD) == []
+            await _spend(users)  # new deltas on top of a pruned ledger
+            expected = {u: await db.get_balance(GUILD, u) for u in users}
+            assert await db.check_rank_cache(GUILD) == []
+        finally:
+            await db.close()
+        await _start(path)
+        try:
+            assert {u: await db.get_balance(GUILD, u) for u in users} == expected
+            assert await db.check_rank_cache(GUILD) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_rank_cache_consistent_after_migrating_v0_database(tmp_path):
+    """A pre-versioning file (TEXT ids, names on users) migrates to the current schema."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    for sql in db.MIGRATIONS[0][1]:
+        conn.execute(sql)
+    conn.executemany(
+        "INSERT INTO users (guild_id, user_id, username, chips, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(GUILD, "7", "seven", 300, "2024-01-01T00:00:00+00:00"),
+         (GUILD, "8", "eight", 300, "2024-01-02T00:00:00+00:00"),
+         (GUILD, "9", "nine", 0, ""),
+         ("2", "7", "elsewhere", 50, "")]
+    )
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        await _start(path)
+        try:
+            assert await db.get_schema_version() == db.SCHEMA_VERSION
+            assert await db.check_rank_cache(GUILD) == []
+            assert await db.get_leaderboard(GUILD, 3) == [
+                {"user_id": "7", "username": "seven", "chips": 300},
+                {"user_id": "8", "username": "eight", "chips": 300},
+                {"user_id": "9", "username": "nine", "chips": 0},
+            ]
+            assert [await db.get_rank(GUILD, u) for u in ("7", "8", "9")] == [1, 1, None]
+            await _spend(["7", "8", "9"])
+            assert await db.check_rank_cache(GUILD) == []
+            assert await db.check_rank_cache("2") == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_rank_cache_consistent_after_journal_replay(tmp_path, monkeypatch):
+    """Chip writes journaled during a Turso outage replay into the same balances."""
+    users = [str(10 + i) for i in range(4)]
+    fake_libsql.install(str(tmp_path / "primary.db"))
+    monkeypatch.setattr(db, "JOURNAL_PROBE_SECONDS", 0.05)
+    monkeypatch.setattr(fake_libsql, "ONLINE", True)
+
+    async def scenario():
+        db.configure("turso", url="libsql://test", token="test", journal=str(tmp_path / "bot.journal"))
+        await db.init()
+        try:
+            await _spend(users)
+            await db.flush_ledger()
+            fake_libsql.ONLINE = False
+            await _spend(users, bulk=False)  # bulk operations need the primary
+            await db.flush_ledger()
+            assert db._degraded and db._journal_size()
+            expected = {u: await db.get_balance(GUILD, u) for u in users}
+            fake_libsql.ONLINE = True
+            for _ in range(200):
+                if not db._degraded:
+                    break
+                await asyncio.sleep(0.01)
+            assert not db._degraded
+            assert await db.check_rank_cache(GUILD) == []
+            db.invalidate_rank_cache(GUILD)  # rebuilt from the primary alone
+            assert {u: await db.get_balance(GUILD, u) for u in users} == expected
+            assert await db.check_rank_cache(GUILD) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())